@@ -0,0 +1,147 @@
+'''
+    Who may pass a gate, as an ordered list of declarative rules. The first rule whose
+    conditions all hold decides. AccessRules compiles the list into a flat decision table
+    over every combination of the facts below, and each fact's value into its offset in
+    that table, so checkTag adds up five offsets and does one tuple index however many
+    rules there are.
+
+        direction  -- 1 in, 2 out
+        last       -- the employee's last clock: 'in' (LogType 3), 'out' (LogType 4) or 'none'
+        passback   -- the last clock is younger than the anti-passback window
+        shift      -- now is inside one of the shift windows (always, when there are none)
+        supervisor -- Employee.Supervisor
+'''
+import time
+import itertools
+import datetime
+
+DIMENSIONS = (
+    ('direction', (1, 2)),
+    ('last', ('in', 'out', 'none')),
+    ('passback', (False, True)),
+    ('shift', (True, False)),
+    ('supervisor', (False, True)),
+)
+
+
+class Rule():
+    __slots__ = ('name', 'allow', 'conditions')
+
+    def __init__(self, name, allow, **conditions):
+        for dimension, value in conditions.items():
+            if dimension not in dict(DIMENSIONS):
+                raise ValueError('unknown condition ' + dimension + ' in rule ' + name)
+            if value not in dict(DIMENSIONS)[dimension]:
+                raise ValueError('unknown ' + dimension + ' ' + repr(value) + ' in rule ' + name)
+        self.name = name
+        self.allow = allow
+        self.conditions = conditions
+
+    def matches(self, case):
+        return all(case[dimension] == value for dimension, value in self.conditions.items())
+
+
+# Same decisions as the original hardware checkTag for everyone who isn't a supervisor
+DEFAULT_RULES = [
+    Rule('already in', False, direction=1, last='in'),
+    Rule('already out', False, direction=2, last='out'),
+    Rule('supervisor override', True, supervisor=True),
+    Rule('outside shift', False, direction=1, shift=False),
+    Rule('in after out', True, direction=1, last='out'),
+    Rule('out after in', True, direction=2, last='in'),
+    Rule('anti-passback', False, passback=True),
+    Rule('allowed', True),
+]
+
+
+class AccessRules():
+    '''
+        rules -- ordered Rules, a case no rule matches is refused
+        passback_window -- ms after a clock during which the same tag is refused
+        shift_windows -- local ('HH:MM', 'HH:MM') ranges entering is allowed in, an end
+        before the start wraps past midnight. None or empty means no shift restriction.
+    '''
+    last_types = {3: 'in', 4: 'out'}
+
+    def __init__(self, rules=DEFAULT_RULES, passback_window=30000, shift_windows=None):
+        self.rules = list(rules)
+        self.passback_window = passback_window
+        self.shift_windows = list(shift_windows or [])
+        self.compile()
+
+    def compile(self):
+        # value -> its offset into the table, per dimension, the last dimension varying fastest
+        offsets = {}
+        stride = 1
+        for name, values in reversed(DIMENSIONS):
+            offsets[name] = {value: i * stride for i, value in enumerate(values)}
+            stride *= len(values)
+        table = []
+        for values in itertools.product(*[values for name, values in DIMENSIONS]):
+            case = dict(zip([name for name, v in DIMENSIONS], values))
+            decision = (False, 'no rule')
+            for rule in self.rules:
+                if rule.matches(case):
+                    decision = (rule.allow, rule.name)
+                    break
+            table.append(decision)
+        self.table = tuple(table)
+        # Looked up straight from what decide() has at hand, a LogType or a bool
+        self.direction_offsets = offsets['direction']
+        self.last_offsets = {log_type: offsets['last'][last] for log_type, last in self.last_types.items()}
+        self.none_offset = offsets['last']['none']
+        self.passback_offsets = (offsets['passback'][False], offsets['passback'][True])
+        self.supervisor_offsets = (offsets['supervisor'][False], offsets['supervisor'][True])
+        # One flag per minute of the day
+        minutes = [not self.shift_windows] * 1440
+        for (start, end) in self.shift_windows:
+            first = minute_of_day(start)
+            last = minute_of_day(end)
+            span = range(first, last) if first <= last else itertools.chain(range(first, 1440), range(0, last))
+            for minute in span:
+                minutes[minute] = True
+        self.shift_minutes = tuple(minutes)
+        self.shift_offsets = tuple(offsets['shift'][inside] for inside in minutes)
+        self.minute = (0, 0)  # (epoch seconds the current local minute ends at, its shift offset)
+
+    def check_direction(self, direction):
+        '''Raises ValueError for a direction no lane can report, call it when building a lane'''
+        if direction not in dict(DIMENSIONS)['direction']:
+            raise ValueError('direction must be 1 (in) or 2 (out), not ' + repr(direction))
+
+    def decide(self, entry, direction, now=None):
+        '''
+            (allowed, name of the deciding rule) for the TagEntry tapping in direction.
+            A fact outside its dimension, e.g. direction 3, is refused as 'unknown <fact>'.
+        '''
+        index = self.direction_offsets.get(direction)
+        if index is None:
+            return (False, 'unknown direction ' + repr(direction))
+        if now is None:
+            seconds = time.time()
+            date = int(seconds * 1000)
+            index += self.current_shift(seconds)
+        else:
+            date = int(now.timestamp() * 1000)
+            index += self.shift_offsets[now.hour * 60 + now.minute]
+        index += self.last_offsets.get(entry.LogType, self.none_offset)
+        index += self.passback_offsets[entry.LogDateUTC + self.passback_window > date]
+        index += self.supervisor_offsets[bool(entry.Supervisor)]
+        return self.table[index]
+
+    def current_shift(self, seconds):
+        '''Shift offset of the local minute seconds falls in, worked out once per minute'''
+        (end, offset) = self.minute
+        if not end - 60 <= seconds < end:
+            now = datetime.datetime.fromtimestamp(seconds)
+            offset = self.shift_offsets[now.hour * 60 + now.minute]
+            self.minute = (seconds - now.second - now.microsecond / 1e6 + 60, offset)
+        return offset
+
+
+def minute_of_day(text):
+    (hours, minutes) = text.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+rules = AccessRules()
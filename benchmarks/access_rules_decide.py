@@ -0,0 +1,74 @@
+'''
+    Time per AccessRules.decide() with the default 8 rules and with 500 more compiled in,
+    called like checkTag does (the clock read inside), against the original hardware
+    checkTag if/elif chain reading the clock for every tag as it did:
+
+        python benchmarks/access_rules_decide.py [calls]
+'''
+import os
+import sys
+import time
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+os.environ['RFID_GATE_DB'] = os.path.join(tempfile.mkdtemp(prefix='rfid_gate_bench'), 'rfid_gate.db')
+
+from access_rules import AccessRules, Rule, DEFAULT_RULES
+from db_utils import TagEntry
+from uid import UID
+
+now = datetime.datetime(2026, 10, 18, 12, 0)
+date = int(now.timestamp() * 1000)
+entries = [TagEntry('bench', UID([4, 23, 91, 192]), log_type, date - age, False, True)
+           for log_type in (0, 3, 4) for age in (1000, 10 ** 9)]
+
+
+def hardware_check_tag(entry, direction, date=None):
+    if date is None:
+        date = int(datetime.datetime.now().timestamp() * 1000)
+    if direction == 1 and entry.LogType == 4:
+        return True
+    elif direction == 2 and entry.LogType == 3:
+        return True
+    elif direction == 1 and entry.LogType == 3:
+        return False
+    elif direction == 2 and entry.LogType == 4:
+        return False
+    elif entry.LogDateUTC + 30000 > date:
+        return False
+    else:
+        return True
+
+
+def per_call(decide, calls):
+    start = time.perf_counter()
+    for i in range(calls // len(entries)):
+        for entry in entries:
+            decide(entry, i % 2 + 1)
+    return (time.perf_counter() - start) / (calls // len(entries) * len(entries))
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 600000
+    # Behind the catch-all 'allowed', so the decisions stay the same
+    padding = [Rule('padding ' + str(i), False, direction=1, last='none', passback=True, shift=False, supervisor=True)
+               for i in range(500)]
+    default = AccessRules()
+    large = AccessRules(DEFAULT_RULES + padding)
+    for entry in entries:
+        for direction in (1, 2):
+            assert default.decide(entry, direction, now) == large.decide(entry, direction, now)
+            assert default.decide(entry, direction, now)[0] == hardware_check_tag(entry, direction, date)
+
+    results = [
+        ('%d rules' % len(default.rules), per_call(default.decide, calls)),
+        ('%d rules' % len(large.rules), per_call(large.decide, calls)),
+        ('if/elif chain', per_call(hardware_check_tag, calls)),
+    ]
+    for (name, seconds) in results:
+        print('%-14s %6.2fus per call' % (name + ':', seconds * 1e6))
+
+
+if __name__ == '__main__':
+    main()
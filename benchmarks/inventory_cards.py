@@ -0,0 +1,69 @@
+'''
+    Cards per second resolved by RC522.inventory() on the simulator, with 1 to 8 cards of
+    mixed 4, 7 and 10 byte UIDs in the field, answering at once or after a latency. The old
+    request + anticoll pass is run on the same field for comparison:
+
+        python benchmarks/inventory_cards.py [seconds per case]
+'''
+import os
+import sys
+import time
+import random
+import builtins
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from rc522 import RC522
+from rc522_sim import MFRC522Sim, VirtualCard
+
+
+def uid(generator, size):
+    data = [generator.randrange(256) for i in range(size)]
+    # A 4 byte UID can't start with the cascade tag, the longer ones start with a maker code
+    data[0] = generator.choice([0x12, 0x34, 0x56]) if size == 4 else 0x04
+    return data
+
+
+def old_pass(reader):
+    '''What the readers did before inventory(), one card at best'''
+    (error, tag_type) = reader.request()
+    if error:
+        return []
+    (error, data) = reader.anticoll()
+    return [] if error else [data]
+
+
+def run(cards, latency, seconds, scan):
+    generator = random.Random(7)
+    sim = MFRC522Sim(latency=latency)
+    for i in range(cards):
+        sim.place(VirtualCard(uid(generator, (4, 7, 10)[i % 3])))
+    reader = RC522(lambda pin: None, transport=sim, shadow=True)
+    found = 0
+    passes = 0
+    sim.reset_stats()
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        # From power up, every card back in IDLE
+        reader.init()
+        found += len(scan(reader))
+        passes += 1
+    elapsed = time.perf_counter() - start
+    return (found / elapsed, found / passes, sim.transactions / max(found, 1))
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    write = sys.stdout.write
+    builtins.print = lambda *args, **kwargs: None
+    for latency in (0, 0.0005):
+        for cards in (1, 2, 4, 8):
+            (rate, per_pass, transactions) = run(cards, latency, seconds, RC522.inventory)
+            (old_rate, old_per_pass, old_transactions) = run(cards, latency, seconds, old_pass)
+            write('latency %.1fms, %d cards: inventory %6.0f cards/s, %.1f found per pass, %3.0f SPI transactions per card'
+                  ' | request+anticoll %.1f found per pass\n'
+                  % (latency * 1000, cards, rate, per_pass, transactions, old_per_pass))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+'''
+    Sustained taps per second through DB.addClock and the clock journal, against committing
+    every tap to SQLite as addClock did before, on a throwaway database:
+
+        python benchmarks/journal_taps.py [taps]
+'''
+import os
+import sys
+import time
+import uuid
+import asyncio
+import builtins
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+directory = tempfile.mkdtemp(prefix='rfid_gate_bench')
+os.environ['RFID_GATE_DB'] = os.path.join(directory, 'rfid_gate.db')
+
+import db_utils
+from database import Session
+from models import Employee, Clock
+from db_utils import DB
+from clock_journal import ClockJournal
+from uid import UID
+
+uid = UID([4, 23, 91, 192])
+baseline_taps = 500
+
+
+async def journaled(taps):
+    flusher = asyncio.create_task(DB.journal.run())
+    worst = 0
+    start = time.perf_counter()
+    for i in range(taps):
+        tap = time.perf_counter()
+        DB.addClock(uid, i % 2 + 1)
+        worst = max(worst, time.perf_counter() - tap)
+        if i % 50 == 0:
+            # Let the flusher have its turn, like the gaps between real taps
+            await asyncio.sleep(0)
+    seconds = time.perf_counter() - start
+    while DB.journal.pending:
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(DB.journal.flush_interval * 2)
+    flusher.cancel()
+    return (seconds, worst)
+
+
+def per_tap_commit(taps):
+    '''What addClock did before the journal: insert, update and commit per tap'''
+    employee = Session.query(Employee).filter_by(EmployeeID='bench').one()
+    start = time.perf_counter()
+    for i in range(taps):
+        date = int(time.time() * 1000)
+        Session.add(Clock(TransactionID=str(uuid.uuid4()), LogType=3, EmployeeID='bench', EmployeeRFID=uid.rfid_code(),
+                          SerialNumber='bench', CreatedDateUTC=date, UpdatedDateUTC=date, DeletedDateUTC=0, ServerDateUTC=0))
+        employee.LogType = 3
+        employee.LogDateUTC = date
+        Session.commit()
+    return time.perf_counter() - start
+
+
+def main():
+    taps = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    write = sys.stdout.write
+    builtins.print = lambda *args, **kwargs: None
+    Session.add(Employee(EmployeeID='bench', RfidCode=uid.rfid_code(), LogType=0, LogDateUTC=0))
+    Session.commit()
+    db_utils.clock_journal = DB.journal = ClockJournal(os.path.join(directory, 'clock_journal.log'), DB.commitClocks)
+    DB.openJournal()
+    DB.loadIndex()
+
+    (seconds, worst) = asyncio.run(journaled(taps))
+    stored = Session.query(Clock).count()
+    write('journal:         %6.0f taps/s, worst tap %.2fms, %d of %d clocks in SQLite\n' % (taps / seconds, worst * 1000, stored, taps))
+    assert stored == taps
+
+    seconds = per_tap_commit(baseline_taps)
+    write('commit per tap:  %6.0f taps/s\n' % (baseline_taps / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+    Taps per minute with 1, 2 and 4 gates on the simulator, each gate seeing a new card
+    every ~0.16s and taking 0.5s to turn: the old single loop serving every reader in turn
+    against one Lane pipeline per gate under its Supervisor.
+
+        python benchmarks/lane_throughput.py [seconds per case]
+'''
+import os
+import sys
+import random
+import asyncio
+import builtins
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from reader_pool import ReaderPool
+from lane import Lane
+from supervisor import Supervisor
+from rc522_sim import MFRC522Sim, VirtualCard
+
+
+class Gate():
+    '''Lets everyone through, relay and turnstile taking their usual time'''
+    relay = 0.05
+    eot = 0.5
+
+    async def checkTag(self, uid, direction):
+        return True
+
+    async def openRelay(self, lane):
+        await asyncio.sleep(self.relay)
+
+    async def waitEOT(self, uid, lane):
+        await asyncio.sleep(self.eot)
+
+    async def failBeep(self):
+        pass
+
+
+async def feed(sim, generator):
+    '''A new person at the reader every 0.16s'''
+    while True:
+        card = sim.place(VirtualCard([generator.randrange(256) for i in range(4)]))
+        await asyncio.sleep(0.15)
+        sim.remove(card)
+        await asyncio.sleep(0.01)
+
+
+async def run(gates, serial, seconds, generator):
+    sims = [MFRC522Sim(latency=0.001) for i in range(gates)]
+    pool = ReaderPool([{'transport': sim, 'pin_irq': i} for i, sim in enumerate(sims)])
+    gate = Gate()
+    lanes = [Lane(gate, pool, i, 1 + i % 2) for i in range(gates)]
+    if serial:
+        async def loop():
+            while True:
+                (index, reader) = await pool.wait_for_any()
+                cards = await reader.inventory(ready=True)
+                for (uid, sak) in cards:
+                    lanes[index].taps += 1
+                    await gate.openRelay(lanes[index])
+                    await gate.waitEOT(uid, lanes[index])
+        tasks = [asyncio.ensure_future(loop())]
+    else:
+        tasks = [asyncio.ensure_future(Supervisor('lane ' + str(lane.index), lane.step, lane.restart).run()) for lane in lanes]
+    tasks += [asyncio.ensure_future(feed(sim, generator)) for sim in sims]
+    await asyncio.sleep(seconds)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return sum(lane.taps for lane in lanes) * 60 / seconds
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    write = sys.stdout.write
+    builtins.print = lambda *args, **kwargs: None
+    generator = random.Random(7)
+    write('gates  serial loop  pipelines   (taps/min)\n')
+    for gates in (1, 2, 4):
+        serial = asyncio.run(run(gates, True, seconds, generator))
+        pipelines = asyncio.run(run(gates, False, seconds, generator))
+        write('%5d  %11.0f  %9.0f\n' % (gates, serial, pipelines))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''
+    Tap latency through ReaderPool.wait_for_any() with 2 to 8 simulated readers, the cards
+    answering after 1ms. A card is put on a random reader at a random moment, per tap:
+
+        wake -- IRQ edge in the GPIO (timer) thread to the pool's caller resumed
+        tap  -- IRQ edge to the card's UID resolved by inventory()
+
+        python benchmarks/reader_pool_latency.py [taps per reader count]
+'''
+import os
+import sys
+import time
+import random
+import asyncio
+import builtins
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from reader_pool import ReaderPool
+from rc522_sim import MFRC522Sim, VirtualCard
+
+
+async def run(readers, taps, generator):
+    sims = [MFRC522Sim(latency=0.001) for i in range(readers)]
+    pool = ReaderPool([{'transport': sim, 'pin_irq': i} for i, sim in enumerate(sims)])
+    loop = asyncio.get_running_loop()
+    tap_times = []
+    for k in range(taps):
+        i = generator.randrange(readers)
+        card = VirtualCard([0x10, 0x20, k >> 8, k & 0xFF])
+        loop.call_later(generator.uniform(0.001, 0.05), sims[i].place, card)
+        (index, reader) = await pool.wait_for_any()
+        assert index == i
+        # inventory()'s own commands raise the IRQ again, keep the card's edge
+        edge = reader.irq_time
+        cards = await reader.inventory(ready=True)
+        tap_times.append(time.monotonic() - edge)
+        assert cards == [(card.uid, 0x08)]
+        sims[i].remove(card)
+    stats = [stats for stats in pool.latency if stats['count']]
+    wake_mean = sum(stats['total'] for stats in stats) / sum(stats['count'] for stats in stats)
+    wake_max = max(stats['max'] for stats in stats)
+    return (wake_mean, wake_max, sum(tap_times) / len(tap_times), max(tap_times))
+
+
+def main():
+    taps = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    write = sys.stdout.write
+    builtins.print = lambda *args, **kwargs: None
+    generator = random.Random(6)
+    for readers in (2, 4, 6, 8):
+        (wake_mean, wake_max, tap_mean, tap_max) = asyncio.run(run(readers, taps, generator))
+        write('%d readers: wake mean %4.0fus max %5.0fus | tap mean %5.2fms max %5.2fms\n'
+              % (readers, wake_mean * 1e6, wake_max * 1e6, tap_mean * 1e3, tap_max * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+'''
+    Soak run of Lane + Supervisor: a million simulated taps, a reader fault every 1000
+    passes. Fails if RSS grows by more than rss_slack KB or the task count changes after
+    the warm-up sample. Manual benchmark, takes a few seconds:
+
+        python benchmarks/soak_supervisor.py [taps]
+'''
+import os
+import sys
+import gc
+import asyncio
+import builtins
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from lane import Lane
+from supervisor import Supervisor
+
+rss_slack = 1024  # KB
+sample_interval = 0.5
+
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+class Gate():
+    async def checkTag(self, uid, direction):
+        return True
+
+    async def openRelay(self, lane):
+        pass
+
+    async def waitEOT(self, uid, lane):
+        pass
+
+    async def failBeep(self):
+        pass
+
+
+class FakeReader():
+    '''Hands out a new 4 byte UID per pass so the tap cache never short cuts one'''
+    def __init__(self):
+        self.passes = 0
+
+    async def init(self):
+        pass
+
+    async def inventory(self, ready=False):
+        self.passes += 1
+        if self.passes % 1000 == 0:
+            raise IOError('bus glitch')
+        return [(list(self.passes.to_bytes(4, 'big')), 0x08)]
+
+
+class FakePool():
+    def __init__(self):
+        self.readers = [FakeReader()]
+
+    async def wait_for(self, index, timeout=None):
+        await asyncio.sleep(0)
+        return self.readers[index]
+
+
+async def soak(taps):
+    lane = Lane(Gate(), FakePool(), 0, 1)
+    supervisor = Supervisor('lane 0', lane.step, lane.restart)
+    supervisor.backoff_min = 0
+    task = asyncio.create_task(supervisor.run())
+    samples = []
+    try:
+        while lane.taps < taps:
+            await asyncio.sleep(sample_interval)
+            gc.collect()
+            samples.append((lane.taps, rss(), len(asyncio.all_tasks())))
+    finally:
+        task.cancel()
+    return (samples, supervisor)
+
+
+def main():
+    taps = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    write = sys.stdout.write
+    # Every tap prints, keep the output to the result
+    builtins.print = lambda *args, **kwargs: None
+    (samples, supervisor) = asyncio.run(soak(taps))
+    # The first sample is the warm-up, caches and the lane's metrics are filled by then
+    (first, middle, last) = (samples[0], samples[len(samples) // 2], samples[-1])
+    for (count, kb, tasks) in (first, middle, last):
+        write('%8d taps: RSS %d KB, %d tasks\n' % (count, kb, tasks))
+    write('errors %d, restarts %d\n' % (supervisor.errors, supervisor.restarts))
+    growth = max(kb for (count, kb, tasks) in samples) - first[1]
+    assert growth <= rss_slack, 'RSS grew by ' + str(growth) + ' KB'
+    assert all(tasks == first[2] for (count, kb, tasks) in samples), 'task count changed'
+    write('flat: RSS within ' + str(growth) + ' KB, task count constant\n')
+
+
+if __name__ == '__main__':
+    main()
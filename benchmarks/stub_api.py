@@ -0,0 +1,131 @@
+'''
+    Local stand-in for the sync API, for the benchmarks. Serves GET /api/v1/employees and
+    /api/v1/logs from generated rows, honouring Everythingafter and PageSize like the real
+    one, and takes POST /api/v1/clock lists. A posted list holding a clock whose EmployeeID
+    starts with 'BAD' is refused whole with a 422. latency seconds are added to every request.
+
+    ties -- rows per ServerDateUTC, consecutive rows share one so a page can end inside a group
+
+    GET /organisations answers with one organisation. While offline is set every request is
+    dropped without an answer, like an API that can't be reached.
+'''
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+def employee(i):
+    return {
+        'EmployeeID': 'E%06d' % i,
+        'Rfid': '',
+        'RfidCode': str([1, (i >> 16) & 0xFF, (i >> 8) & 0xFF, i & 0xFF, 1 ^ ((i >> 16) & 0xFF) ^ ((i >> 8) & 0xFF) ^ (i & 0xFF)]),
+        'Startdate': None,
+        'Termdate': None,
+        'Supervisor': False,
+        'CreatedDateUTC': i,
+        'UpdatedDateUTC': i,
+        'DeletedDateUTC': 0,
+        'ServerDateUTC': i + 1,
+    }
+
+
+def log(i):
+    return {
+        'TransactionID': 'T%08d' % i,
+        'LogType': 3 + i % 2,
+        'People': [{'PersonID': 'E%06d' % (i % 1000), 'PersonRFID': ''}],
+        'CreatedDateUTC': i,
+        'UpdatedDateUTC': i,
+        'DeletedDateUTC': 0,
+        'ServerDateUTC': i + 1,
+    }
+
+
+class StubAPI():
+    def __init__(self, employees=0, logs=0, latency=0, ties=1):
+        self.lists = {'employees': ('Employees', employees, employee), 'logs': ('Logs', logs, log)}
+        self.latency = latency
+        self.ties = ties
+        self.offline = False
+        self.requests = 0
+        self.clocks = set()  # TransactionIDs accepted
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body leave in one segment, no delayed ACK stalls on top of latency
+            wbufsize = 65536
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if api.offline:
+                    self.close_connection = True
+                    return
+                api.handle_get(self)
+
+            def do_POST(self):
+                if api.offline:
+                    self.close_connection = True
+                    return
+                api.handle_post(self)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:' + str(self.server.server_port) + '/api/v1/'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reply(self, handler, status, body):
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+        handler.wfile.flush()
+
+    def handle_get(self, handler):
+        self.requests += 1
+        time.sleep(self.latency)
+        url = urlparse(handler.path)
+        name = url.path.rsplit('/', 1)[-1]
+        if name == 'organisations':
+            return self.reply(handler, 200, b'{"Connections": [{"tenantId": "stub-tenant", "name": "Stub"}]}')
+        if name not in self.lists:
+            return self.reply(handler, 404, b'{}')
+        (key, count, make) = self.lists[name]
+        query = parse_qs(url.query)
+        # Row i has ServerDateUTC i // ties + 1, so the rows after a checkpoint start at its value times ties
+        first = int(query.get('Everythingafter', ['0'])[0]) * self.ties
+        last = min(count, first + int(query.get('PageSize', [count])[0]))
+        body = json.dumps({key: [self.row(make, i) for i in range(first, last)]}).encode()
+        self.reply(handler, 200, body)
+
+    def row(self, make, i):
+        row = make(i)
+        row['ServerDateUTC'] = i // self.ties + 1
+        return row
+
+    def handle_post(self, handler):
+        self.requests += 1
+        clocks = json.loads(handler.rfile.read(int(handler.headers.get('Content-Length', 0))))
+        time.sleep(self.latency)
+        if urlparse(handler.path).path.rsplit('/', 1)[-1] != 'clock':
+            return self.reply(handler, 404, b'{}')
+        if any(clock['EmployeeID'].startswith('BAD') for clock in clocks):
+            return self.reply(handler, 422, b'{"error": "unknown employee"}')
+        self.clocks.update(clock['TransactionID'] for clock in clocks)
+        self.reply(handler, 200, b'{}')
@@ -0,0 +1,111 @@
+'''
+    Memory used pulling a 200k-row employee list from the stub API, on a throwaway database:
+
+        python benchmarks/sync_memory.py [rows]
+
+    whole body  -- what DB.asyncAll did before paging: one response, req.json()
+    streamed    -- DB.pull with the whole list in one response, parsed off the socket
+    paged       -- DB.pull with the default page size
+
+    Every case runs twice in a process of its own, forked from this one: once for its time
+    and how far it raised the max RSS, once under tracemalloc for the peak of Python
+    allocations on every thread. kept is what is still allocated at the end, for DB.pull
+    that is the in-memory tag index of 200k employees, which the device holds anyway.
+    working is the peak less kept, what the pull itself needed on the way.
+    The stub API runs in another process, its responses aren't counted.
+'''
+import os
+import sys
+import time
+import asyncio
+import builtins
+import resource
+import tempfile
+import tracemalloc
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+os.environ['RFID_GATE_DB'] = os.path.join(tempfile.mkdtemp(prefix='rfid_gate_bench'), 'rfid_gate.db')
+
+import requests
+from stub_api import StubAPI
+from sqlalchemy import text
+from database import engine, Session
+from models import Employee
+from db_utils import DB
+from token_manager import tokens
+from config_store import settings
+
+fork = multiprocessing.get_context('fork')
+
+
+def whole_body(api, rows):
+    '''The old pull, the whole list as one parsed document'''
+    items = requests.get(api.url + 'employees', params={'Everythingafter': '0', 'PageSize': rows}).json()['Employees']
+    return len(items)
+
+
+def pull(page_size):
+    DB.page_size = page_size
+    asyncio.run(DB.pull('employees', 'Employees', 'EmployeeID', 'EmployeeSyncUTC', DB.storeEmployees))
+    return Session.query(Employee).count()
+
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def case(run, traced, results):
+    if traced:
+        tracemalloc.start()
+    before = rss()
+    start = time.perf_counter()
+    count = run()
+    seconds = time.perf_counter() - start
+    (kept, peak) = tracemalloc.get_traced_memory() if traced else (0, 0)
+    raised = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - before
+    # Leave the database as it was for the next case
+    Session.execute(text('DELETE FROM employee'))
+    Session.commit()
+    settings.update(EmployeeSyncUTC=0)
+    results.put((count, seconds, raised, peak, kept))
+
+
+def measure(run):
+    results = fork.Queue()
+    measured = []
+    for traced in (False, True):
+        # A forked child must not inherit open SQLite connections
+        Session.remove()
+        engine.dispose()
+        child = fork.Process(target=case, args=(run, traced, results))
+        child.start()
+        measured.append(results.get())
+        child.join()
+    ((count, seconds, raised, _, _), (_, _, _, peak, kept)) = measured
+    return (count, seconds, raised, peak, kept)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    write = sys.stdout.write
+    builtins.print = lambda *args, **kwargs: None
+    api = StubAPI(employees=rows)
+    server = fork.Process(target=api.server.serve_forever, daemon=True)
+    server.start()
+    api.server.socket.close()
+    DB.api = api.url
+    tokens.store('stub', 10 ** 9)
+    DB.loadIndex()
+    try:
+        for (name, run) in (('paged', lambda: pull(5000)), ('streamed', lambda: pull(rows)), ('whole body', lambda: whole_body(api, rows))):
+            (count, seconds, raised, peak, kept) = measure(run)
+            write('%-11s %6d rows in %5.2fs, max RSS +%5.1f MB, tracemalloc peak %5.1f MB, kept %5.1f MB, working %5.1f MB\n'
+                  % (name + ':', count, seconds, raised / 2 ** 20, peak / 2 ** 20, kept / 2 ** 20, (peak - kept) / 2 ** 20))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+'''
+    Rows per second of the sync-down path against a local stub API (benchmarks/stub_api.py),
+    on a throwaway database:
+
+        python benchmarks/sync_pull.py [rows]
+
+    baseline    -- the old loop: a query, an ORM merge and a commit per row (the 0.1s sleep
+                   per row it also had is left out, it would only add rows * 0.1s)
+    bulk insert -- DB.pull into empty tables, INSERT ... ON CONFLICT per page, one commit
+    bulk update -- the same rows pulled again from checkpoint 0, every row a conflict
+'''
+import os
+import sys
+import time
+import asyncio
+import builtins
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+os.environ['RFID_GATE_DB'] = os.path.join(tempfile.mkdtemp(prefix='rfid_gate_bench'), 'rfid_gate.db')
+
+from stub_api import StubAPI
+from sqlalchemy import text
+from database import Session
+from models import Employee, Clock
+from db_utils import DB
+from token_manager import tokens
+from config_store import settings
+
+baseline_rows = 1000
+
+
+def baseline(api, rows):
+    '''The per-row upsert DB.asyncAll did before bulkUpsert'''
+    import requests
+    items = requests.get(api.url + 'employees', params={'Everythingafter': '0', 'PageSize': rows}).json()['Employees']
+    s = Session
+    start = time.perf_counter()
+    for item in items:
+        row = s.query(Employee).filter_by(EmployeeID=item['EmployeeID']).first()
+        if row:
+            DB.updateModel(row, item, Employee)
+        else:
+            s.add(Employee(**DB.employeeRow(item)))
+        s.commit()
+    return time.perf_counter() - start
+
+
+async def pull():
+    start = time.perf_counter()
+    await DB.pull('employees', 'Employees', 'EmployeeID', 'EmployeeSyncUTC', DB.storeEmployees)
+    await DB.pull('logs', 'Logs', 'TransactionID', 'LogSyncUTC', DB.storeClocks)
+    return time.perf_counter() - start
+
+
+def reset(tables):
+    for table in tables:
+        Session.execute(text('DELETE FROM "' + table + '"'))
+    Session.commit()
+    DB.validators.clear()
+    settings.update(EmployeeSyncUTC=0, LogSyncUTC=0)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    write = sys.stdout.write
+    builtins.print = lambda *args, **kwargs: None
+    api = StubAPI(employees=rows, logs=rows).start()
+    DB.api = api.url
+    tokens.store('stub', 10 ** 9)
+
+    seconds = baseline(api, baseline_rows)
+    write('baseline:    %6d rows in %6.2fs, %8.0f rows/s\n' % (baseline_rows, seconds, baseline_rows / seconds))
+    reset(['employee'])
+
+    seconds = asyncio.run(pull())
+    count = Session.query(Employee).count() + Session.query(Clock).count()
+    write('bulk insert: %6d rows in %6.2fs, %8.0f rows/s, %d requests\n' % (count, seconds, count / seconds, api.requests))
+    assert count == 2 * rows
+
+    settings.update(EmployeeSyncUTC=0, LogSyncUTC=0)
+    DB.validators.clear()
+    seconds = asyncio.run(pull())
+    write('bulk update: %6d rows in %6.2fs, %8.0f rows/s\n' % (count, seconds, count / seconds))
+    api.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+'''
+    Taps during a sync-down: a tap every millisecond through DB.addClock and the clock
+    journal while DB.pull upserts employees and logs from the stub API, against the same
+    taps with no sync running. Reports taps/s, the tap (addClock) latency and the longest
+    group commit of the journal, which waits whenever the sync holds the SQLite write lock.
+    The stub API runs in another process so it doesn't compete for the GIL:
+
+        python benchmarks/sync_taps.py [rows per list]
+'''
+import os
+import sys
+import time
+import asyncio
+import builtins
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+directory = tempfile.mkdtemp(prefix='rfid_gate_bench')
+os.environ['RFID_GATE_DB'] = os.path.join(directory, 'rfid_gate.db')
+
+import db_utils
+from database import Session
+from models import Employee, Clock
+from db_utils import DB
+from clock_journal import ClockJournal
+from config_store import settings
+from token_manager import tokens
+from stub_api import StubAPI
+from uid import UID
+
+uid = UID([4, 23, 91, 192])
+fork = multiprocessing.get_context('fork')
+
+
+async def tap(sync, seconds):
+    '''Taps until sync is done (or for seconds without one), returns (taps, seconds, tap latencies)'''
+    flusher = asyncio.ensure_future(DB.journal.run())
+    syncing = asyncio.ensure_future(sync()) if sync else None
+    latencies = []
+    start = time.perf_counter()
+    while not syncing.done() if syncing else time.perf_counter() - start < seconds:
+        before = time.perf_counter()
+        DB.addClock(uid, len(latencies) % 2 + 1)
+        latencies.append(time.perf_counter() - before)
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    if syncing:
+        await syncing
+    while DB.journal.pending:
+        await asyncio.sleep(0.01)
+    flusher.cancel()
+    return (len(latencies), elapsed, latencies)
+
+
+async def sync():
+    await DB.pull('employees', 'Employees', 'EmployeeID', 'EmployeeSyncUTC', DB.storeEmployees)
+    await DB.pull('logs', 'Logs', 'TransactionID', 'LogSyncUTC', DB.storeClocks)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    write = sys.stdout.write
+    builtins.print = lambda *args, **kwargs: None
+    api = StubAPI(employees=rows, logs=rows)
+    server = fork.Process(target=api.server.serve_forever, daemon=True)
+    server.start()
+    api.server.socket.close()
+    DB.api = api.url
+    Session.add(Employee(EmployeeID='bench', RfidCode=uid.rfid_code(), LogType=0, LogDateUTC=0))
+    Session.commit()
+    commits = []
+
+    def commit(batch):
+        start = time.perf_counter()
+        DB.commitClocks(batch)
+        commits.append(time.perf_counter() - start)
+
+    db_utils.clock_journal = DB.journal = ClockJournal(os.path.join(directory, 'clock_journal.log'), commit)
+    DB.openJournal()
+    DB.loadIndex()
+    settings.update(EmployeeSyncUTC=0, LogSyncUTC=0)
+    tokens.store('stub', 10 ** 9)
+    total = 0
+    try:
+        for (name, run) in (('no sync', None), ('during sync', sync)):
+            del commits[:]
+            (taps, seconds, latencies) = asyncio.run(tap(run, 3))
+            total += taps
+            latencies.sort()
+            write('%-12s %4.0f taps/s over %5.2fs | tap p50 %3.0fus p99 %4.0fus max %5.2fms | %3d group commits, longest %5.2fms\n' % (
+                name + ':', taps / seconds, seconds, latencies[len(latencies) // 2] * 1e6, latencies[len(latencies) * 99 // 100] * 1e6,
+                latencies[-1] * 1e3, len(commits), max(commits) * 1e3))
+    finally:
+        server.terminate()
+    assert Session.query(Clock).filter_by(EmployeeID='bench').count() == total
+    assert Session.query(Employee).count() == rows + 1
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+'''
+    Clock upload against a local mock server adding latency to every request
+    (benchmarks/stub_api.py), on a throwaway database:
+
+        python benchmarks/sync_upload.py [clocks] [latency seconds]
+
+    The same backlog, with a few records the server refuses, is uploaded one clock per
+    request and commit (what DB.asyncAll used to do) and DB.upload_batch at a time. The
+    requests of the sync after are counted too: the refused records, backed off, cost none.
+'''
+import os
+import sys
+import time
+import asyncio
+import builtins
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+os.environ['RFID_GATE_DB'] = os.path.join(tempfile.mkdtemp(prefix='rfid_gate_bench'), 'rfid_gate.db')
+
+from stub_api import StubAPI
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from database import Session
+from models import Clock
+from db_utils import DB
+
+bad_every = 500  # one clock in this many is refused by the server
+
+
+def seed(count):
+    Session.execute(text('DELETE FROM "Clock"'))
+    Session.execute(insert(Clock.__table__), [{
+        'TransactionID': 'T%08d' % i,
+        'LogType': 3,
+        'EmployeeID': ('BAD%05d' if i % bad_every == bad_every - 1 else 'E%06d') % i,
+        'EmployeeRFID': '',
+        'SerialNumber': 'bench',
+        'CreatedDateUTC': i,
+        'UpdatedDateUTC': i,
+        'DeletedDateUTC': 0,
+        'ServerDateUTC': 0,
+    } for i in range(count)])
+    Session.commit()
+
+
+def upload(api, count, batch):
+    seed(count)
+    api.requests = 0
+    api.clocks.clear()
+    DB.upload_batch = batch
+    start = time.perf_counter()
+    asyncio.run(DB.uploadClocks({}))
+    seconds = time.perf_counter() - start
+    pending = DB.unsyncedClocks().count()
+    bad = count // bad_every
+    # Everything but the refused records got through, and only those stay pending
+    assert len(api.clocks) == count - bad, (len(api.clocks), count - bad)
+    assert pending == bad, pending
+    requests = api.requests
+    api.requests = 0
+    asyncio.run(DB.uploadClocks({}))
+    return (seconds, requests, pending, api.requests)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    write = sys.stdout.write
+    builtins.print = lambda *args, **kwargs: None
+    api = StubAPI(latency=latency).start()
+    DB.api = api.url
+    write('%d clocks, %d refused, %.0fms per request\n' % (count, count // bad_every, latency * 1000))
+    for batch in (1, DB.upload_batch):
+        (seconds, requests, pending, next_requests) = upload(api, count, batch)
+        write('batch %3d: %6.2fs, %5d requests, %6.0f clocks/s, %d left pending, %d requests the sync after\n'
+              % (batch, seconds, requests, count / seconds, pending, next_requests))
+    api.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import os
+import json
+import asyncio
+
+
+class ClockJournal():
+    '''
+        Append-only journal in front of the Clock table. append() is a single write() of one
+        JSON line, cheap enough for the gate path. run() is the background flusher: it fsyncs
+        the journal and group-commits everything pending into SQLite with one commit, then
+        empties the journal once SQLite holds all of it. Both run on a worker thread, so a
+        sync holding the SQLite write lock delays the commit but never the taps.
+
+        commit -- callable writing a list of records to SQLite in one transaction. It must be
+        idempotent (a crash after the commit but before the truncate replays the records)
+        and must not share a session with the event loop thread.
+
+        Records in the journal survive a process crash straight away and a power cut once
+        fsynced, at most flush_interval later. open() replays whatever a crash left behind.
+    '''
+    flush_interval = 0.5
+    flush_size = 64
+
+    def __init__(self, path, commit):
+        self.path = path
+        self.commit = commit
+        self.pending = []
+        self.fd = None
+        self.wake = None
+
+    def open(self):
+        '''Replays records left by a crash, then starts an empty journal'''
+        records = self.read()
+        if records:
+            self.commit(records)
+            print('replayed ' + str(len(records)) + ' clocks from the journal')
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.ftruncate(self.fd, 0)
+        os.fsync(self.fd)
+
+    def read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        records = []
+        # Everything after the last newline is a write torn by the crash
+        for line in data.split(b'\n')[:-1]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                print('skipping corrupt journal record: ' + repr(line))
+        return records
+
+    def append(self, record):
+        os.write(self.fd, (json.dumps(record, separators=(',', ':')) + '\n').encode())
+        self.pending.append(record)
+        if len(self.pending) >= self.flush_size and self.wake is not None:
+            self.wake.set()
+
+    async def run(self):
+        self.wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # The records stay pending and in the journal, try again next round
+                print('clock journal flush failed: ' + str(e))
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch = self.pending
+        self.pending = []
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.write, batch)
+        except Exception:
+            self.pending = batch + self.pending
+            raise
+        if not self.pending:
+            os.ftruncate(self.fd, 0)
+
+    def write(self, batch):
+        os.fsync(self.fd)
+        self.commit(batch)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
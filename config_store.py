@@ -0,0 +1,87 @@
+import uuid
+import platform
+from types import SimpleNamespace
+
+from models import Config
+from database import Session
+
+
+def getSerial():
+    # Extract serial from cpuinfo file
+    cpuserial = "0000000000000000"
+    try:
+        f = open('/proc/cpuinfo','r')
+        for line in f:
+            if line[0:6]=='Serial':
+                cpuserial = line[10:26]
+        f.close()
+    except:
+        cpuserial = "ERROR000000000"
+
+    return cpuserial
+
+
+class ConfigStore():
+    '''
+        The device Config row, loaded once and kept in memory. get() returns a plain snapshot
+        (attribute per column) without touching SQLite, update() writes through to the row
+        and then tells the subscribers which fields changed.
+
+        subscribe(callback, fields) -- callback(changes) with {field: new value}, called
+        only when one of fields (any field when None) changed. Runs on the updating thread,
+        keep it short.
+    '''
+    def __init__(self):
+        self.values = None
+        self.subscribers = []
+
+    def load(self):
+        session = Session.session_factory()
+        try:
+            config = session.query(Config).first()
+            if not config:
+                session.add(Config(
+                    ConfigID=str(uuid.uuid4()),
+                    OrganisationID='07a4c9b2-e6f9-497f-8140-2d767a54488f',
+                    System = platform.system(),
+                    SystemVersion = platform.release(),
+                    Serial = getSerial()
+                ))
+                session.commit()
+                config = session.query(Config).first()
+            self.values = SimpleNamespace(**{column.name: getattr(config, column.name) for column in Config.__table__.columns})
+        finally:
+            session.close()
+        return self.values
+
+    def get(self):
+        if self.values is None:
+            self.load()
+        return self.values
+
+    def update(self, **fields):
+        values = self.get()
+        changes = {name: value for name, value in fields.items() if getattr(values, name) != value}
+        if not changes:
+            return values
+        # Own short session, a commit on the loop's session could land in the middle of a sync
+        session = Session.session_factory()
+        try:
+            config = session.query(Config).first()
+            for name, value in changes.items():
+                setattr(config, name, value)
+            session.commit()
+        finally:
+            session.close()
+        for name, value in changes.items():
+            setattr(values, name, value)
+        for (callback, names) in self.subscribers:
+            if names is None or any(name in changes for name in names):
+                callback(changes)
+        return values
+
+    def subscribe(self, callback, fields=None):
+        self.subscribers.append((callback, fields))
+
+
+settings = ConfigStore()
@@ -0,0 +1,39 @@
+'''
+    The one engine and session provider for rfid_gate.db. Import engine and Session from
+    here instead of calling create_engine.
+
+    Session is a scoped_session: every thread (the event loop, executor workers, IRQ
+    callbacks) gets its own session and connection, so ORM objects never cross threads.
+    Module code can keep using it like a session, e.g. Session.query(...), Session.commit().
+'''
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+# RFID_GATE_DB points elsewhere, e.g. the tests' throwaway database
+db_path = os.environ.get('RFID_GATE_DB') or os.path.join(os.path.dirname(os.path.realpath(__file__)), "rfid_gate.db")
+
+# Applied to every new connection. WAL lets readers carry on while a sync writes, with
+# synchronous=NORMAL a commit only fsyncs at checkpoints (the clock journal covers the gap)
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -8000,  # KiB, 8MB page cache per connection
+    'mmap_size': 64 * 1024 * 1024,
+    'busy_timeout': 5000,  # ms a writer waits for another writer's lock
+    'temp_store': 'MEMORY',
+}
+
+engine = create_engine("sqlite:///" + db_path, connect_args={'check_same_thread': False})
+
+
+@event.listens_for(engine, 'connect')
+def set_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in PRAGMAS.items():
+        cursor.execute('PRAGMA ' + name + ' = ' + str(value))
+    cursor.close()
+
+
+Session = scoped_session(sessionmaker(bind=engine))
@@ -1,52 +1,180 @@
 import os
 import datetime
-import requests
 import copy
 import asyncio
-import json
 import uuid
+import time
+from email.utils import formatdate
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.engine.base import Transaction
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.sql.elements import Null
-from models import Employee, Config, Clock
-from types import SimpleNamespace
+from models import Employee, Clock
+from http_client import http
+from database import Session
+from token_manager import tokens
+from config_store import settings
+from json_stream import iter_array, take
+from clock_journal import ClockJournal
+from uid import UID
+from metrics import metrics, sync_buckets
 
-dir_name = os.path.join(os.path.dirname(os.path.realpath(__file__)), "rfid_gate.db")
-engine = create_engine("sqlite:///"+dir_name)
-Session = sessionmaker(bind=engine)
-s = Session()
+journal_name = os.path.join(os.path.dirname(os.path.realpath(__file__)), "clock_journal.log")
+s = Session
 
 req_timeout = 10
 
-def checkTokenTime(func):
-    """
-    decorator function that checks the token expiry before doing server calls
-    """
-    def wrapper(*args, **kwargs):
-        config = s.query(Config).first()
-        time_left = config.LastAuthDateUTC + (config.ExpiredToken * 1000) - int(datetime.datetime.now().timestamp() * 1000)
-        if time_left < 10:  # give 10 seconds grace
-            files = {
-                'grant_type': (None, 'client_credentials'),
-                'client_id': (None, 'client_id'),
-                'client_secret': (None, 'A8E7EA2D-285A-4908-96D4-EB249F179DBD'),
-                'scope': (None, 'pahapi pahapi.read roles'),
-            }
-            req = requests.post("https://planaheadgroup.com/connect/token", timeout=req_timeout, files=files)
-            tokenset = json.loads(req.text, object_hook=lambda d: SimpleNamespace(**d))
-            if req.status_code == 200:
-                print('Successful Refresh Token Response:')
-                config.AccessToken = tokenset.access_token
-                config.ExpiredToken =  tokenset.expires_in
-                config.LastAuthDateUTC = int(datetime.datetime.now().timestamp() * 1000)
-                s.commit()
-                # return config
-        return func(*args, **kwargs)
-    return wrapper
+
+class TagEntry():
+    '''What checkTag needs to know about the employee behind a tag'''
+    __slots__ = ('EmployeeID', 'uid', 'LogType', 'LogDateUTC', 'Supervisor', 'active')
+
+    def __init__(self, EmployeeID, uid, LogType, LogDateUTC, Supervisor, active):
+        self.EmployeeID = EmployeeID
+        self.uid = uid
+        self.LogType = LogType
+        self.LogDateUTC = LogDateUTC
+        self.Supervisor = Supervisor
+        self.active = active
+
+
+class TagIndex():
+    '''
+        In-memory authorization index keyed by the UID an employee's RfidCode (or Rfid)
+        decodes to, so a tap never waits on SQLite. Loaded once from the Employee table,
+        then kept up to date by DB.addClock and the sync in DB.asyncAll.
+
+        subscribe(callback) -- callback(uid) whenever what is known about the holder of uid
+        changes: a clock, a new or lost tag, a sync update. Runs on the updating thread.
+    '''
+    def __init__(self):
+        self.loaded = False
+        self.employees = {}  # EmployeeID -> TagEntry
+        self.tags = {}  # UID -> [active TagEntry, ...]
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def changed(self, uid):
+        if uid is None:
+            return
+        for callback in self.subscribers:
+            callback(uid)
+
+    def load(self, session):
+        self.employees = {}
+        self.tags = {}
+        rows = session.query(Employee.EmployeeID, Employee.RfidCode, Employee.Rfid, Employee.LogType, Employee.LogDateUTC, Employee.Supervisor, Employee.Termdate)
+        for row in rows:
+            self.update_employee(row)
+        self.loaded = True
+
+    def get(self, uid):
+        '''Active employees holding this tag, normally exactly one'''
+        holders = self.tags.get(uid)
+        if holders is None and uid.size > 4:
+            # Stored before full UIDs were, as its level 1 frame
+            holders = self.tags.get(uid.prefix())
+        return holders or ()
+
+    def put(self, entry):
+        old = self.employees.get(entry.EmployeeID)
+        if old is not None and old.active:
+            holders = self.tags.get(old.uid)
+            if holders is not None and old in holders:
+                holders.remove(old)
+                if not holders:
+                    del self.tags[old.uid]
+        self.employees[entry.EmployeeID] = entry
+        if entry.active and entry.uid is not None:
+            self.tags.setdefault(entry.uid, []).append(entry)
+        if old is not None and old.uid != entry.uid:
+            self.changed(old.uid)
+        self.changed(entry.uid)
+
+    def update_employee(self, row):
+        self.put(TagEntry(row.EmployeeID, UID.from_server(row.RfidCode, row.Rfid), row.LogType, row.LogDateUTC, row.Supervisor, row.Termdate is None))
+
+    def sync_employee(self, data):
+        '''Employee dict pulled from the server, the clocking state stays the device's own'''
+        old = self.employees.get(data['EmployeeID'])
+        self.put(TagEntry(
+            data['EmployeeID'],
+            UID.from_server(data['RfidCode'], data['Rfid']),
+            old.LogType if old else 0,
+            old.LogDateUTC if old else 0,
+            data['Supervisor'],
+            data['Termdate'] is None
+        ))
+
+    def update_clock(self, EmployeeID, LogType, LogDateUTC):
+        entry = self.employees.get(EmployeeID)
+        if entry is not None:
+            entry.LogType = LogType
+            entry.LogDateUTC = LogDateUTC
+            self.changed(entry.uid)
+
+
+tag_index = TagIndex()
+
+clock_time = metrics.histogram('rfid_gate_clock_record_seconds', 'DB.addClock, the journal append and index update of a tap')
+sync_phase = lambda name: metrics.histogram('rfid_gate_sync_phase_seconds', 'Time spent in each phase of a sync cycle', sync_buckets, phase=name)
+sync_failures = metrics.counter('rfid_gate_sync_failures_total', 'Sync cycles ended by an error, usually offline')
 
 class DB():
+    index = tag_index
+
+    # Pulled rows are upserted this many at a time, yielding to the event loop whenever
+    # sync_slice seconds of work have passed
+    sync_chunk = 500
+    sync_slice = 0.02
+
+    # Pulls ask for page_size rows per request and read the body read_size bytes at a time
+    api = 'https://api.planaheadgroup.com/api/v1/'
+    page_size = 5000
+    read_size = 65536
+
+    # path -> (checkpoint asked for, ETag, Last-Modified) of the last complete pull
+    validators = {}
+
+    # Bytes on the wire, both directions, of the last sync cycle
+    sync_bytes = 0
+
+    # Server fields written on insert and overwritten on conflict, the key column excluded
+    employee_columns = ['Rfid', 'RfidCode', 'Startdate', 'Termdate', 'Supervisor', 'CreatedDateUTC', 'UpdatedDateUTC', 'DeletedDateUTC', 'ServerDateUTC']
+    clock_columns = ['LogType', 'CreatedDateUTC', 'UpdatedDateUTC', 'DeletedDateUTC', 'ServerDateUTC']
+
+    # Pending clocks posted per request, and the statuses meaning the content was refused
+    upload_batch = 100
+    upload_rejected = (400, 409, 422)
+
+    # A clock refused on its own is left out of the batches and retried alone, first after
+    # reject_backoff_min seconds, doubling up to reject_backoff_max
+    reject_backoff_min = 60
+    reject_backoff_max = 24 * 60 * 60
+
+    # Clock columns kept for the device's own bookkeeping, never posted
+    unsent_columns = ('Rejections', 'RejectedUTC')
+
+    # Seconds between syncs, a change of organisation starts the next one straight away
+    sync_interval = 60
+    sync_wake = None
+
+    # Phases of a sync cycle, timed into rfid_gate_sync_phase_seconds
+    sync_phases = {name: sync_phase(name) for name in ('employees', 'logs', 'upload', 'cycle')}
+
+    def loadIndex():
+        tag_index.load(s)
+        print('tag index loaded: ' + str(len(tag_index.employees)) + ' employees')
+
+    def getTag(uid):
+        '''Active employees holding the UID, from the in-memory index'''
+        if not tag_index.loaded:
+            DB.loadIndex()
+        return tag_index.get(uid)
+
     def getFilterObjects(model, query):
         arr = []
         rows = s.query(model).filter(text(query)).all()
@@ -73,148 +201,326 @@ class DB():
             return s.query(model).first()
 
     def updateOrg(self, OrganisationID, Name):
-        config = s.query(Config).first()
-        config.OrganisationID = OrganisationID
-        config.Name = Name
-        s.commit()
-        return config
-
-    def addClock(employee_rfid, direction):
-        config = s.query(Config).first()
-        employee = s.query(Employee).filter_by(RfidCode=employee_rfid).first()
-        date = int(datetime.datetime.now().timestamp() * 1000)
-        s.add(Clock(
-            TransactionID = str(uuid.uuid4()),
-            LogType = 3 if direction == 1 else 4,
-            EmployeeID = employee.EmployeeID,
-            EmployeeRFID = employee_rfid,
-            SerialNumber = config.Serial,
-            CreatedDateUTC = date,
-            UpdatedDateUTC = date,
-            DeletedDateUTC = 0,
-            ServerDateUTC = 0
-        ))
-        employee.UpdatedDateUTC = date
-        if direction == 1:
-            employee.LogType = 3
-            employee.LogDateUTC = date
+        return settings.update(OrganisationID=OrganisationID, Name=Name)
+
+    def openJournal():
+        '''Replays clocks a crash left in the journal, call before loadIndex'''
+        clock_journal.open()
+
+    def addClock(uid, direction):
+        '''
+            Records a tap of the UID. Only the journal append and the index update happen
+            here, the clock reaches SQLite with the next group commit of clock_journal.run()
+        '''
+        employee_rfid = uid.rfid_code()
+        start = time.monotonic()
+        holders = tag_index.get(uid)
+        if holders:
+            employee_id = holders[0].EmployeeID
         else:
-            employee.LogType = 4
-            employee.LogDateUTC = date
-        s.commit()
+            employee = s.query(Employee).filter_by(RfidCode=employee_rfid).first()
+            if employee is None:
+                print('no employee for ' + str(uid) + ', clock not recorded')
+                return
+            employee_id = employee.EmployeeID
+        date = int(datetime.datetime.now().timestamp() * 1000)
+        log_type = 3 if direction == 1 else 4
+        clock_journal.append({
+            'TransactionID': str(uuid.uuid4()),
+            'LogType': log_type,
+            'EmployeeID': employee_id,
+            'EmployeeRFID': employee_rfid,
+            'SerialNumber': settings.get().Serial,
+            'CreatedDateUTC': date
+        })
+        tag_index.update_clock(employee_id, log_type, date)
+        clock_time.observe(time.monotonic() - start)
+
+    def commitClocks(records):
+        '''
+            Writes journaled clocks and the employees' clocking state in one transaction.
+            Safe to repeat: known TransactionIDs are skipped and an employee only moves forward in time.
+            Runs on the journal's worker thread, s is that thread's own session
+        '''
+        clocks = [dict(record, UpdatedDateUTC=record['CreatedDateUTC'], DeletedDateUTC=0, ServerDateUTC=0) for record in records]
+        try:
+            s.execute(insert(Clock.__table__).on_conflict_do_nothing(index_elements=['TransactionID']), clocks)
+            s.execute(text(
+                'UPDATE employee SET LogType = :LogType, LogDateUTC = :CreatedDateUTC, UpdatedDateUTC = :CreatedDateUTC '
+                'WHERE EmployeeID = :EmployeeID AND (LogDateUTC IS NULL OR LogDateUTC <= :CreatedDateUTC)'
+            ), records)
+            s.commit()
+        except Exception:
+            s.rollback()
+            raise
+
+    def syncNow(changes):
+        if DB.sync_wake is not None:
+            DB.sync_wake.set()
 
-    @checkTokenTime
     async def asyncAll():
+        if DB.sync_wake is None:
+            settings.subscribe(DB.syncNow, ('OrganisationID',))
+        DB.sync_wake = asyncio.Event()
         looping = True
         while looping:
             try:
                 # sync device data up to server
                 await asyncio.sleep(0.1)
-                config = s.query(Config).first()
-                temp_server_date = config.LastSyncUTC
-                # sync server data down to device
-                headers = {
-                    'pah-tenant-id': config.OrganisationID,
-                    'Authorization': 'Bearer ' + str(config.AccessToken)
-                }
-                req = requests.get(
-                    'https://api.planaheadgroup.com/api/v1/employees',
-                    timeout=req_timeout,
-                    headers=headers,
-                    params={'Everythingafter': str(config.LastSyncUTC)}
-                )
-                if req.status_code == 200:
-                    data = req.json()
-                    for employee in data['Employees']:
-                        row = s.query(Employee).filter_by(EmployeeID=employee['EmployeeID']).first()
-                        if row:
-                            DB.updateModel(row, employee, Employee)
-                        else:
-                            s.add(Employee(
-                                EmployeeID=employee['EmployeeID'],
-                                Rfid=employee['Rfid'],
-                                RfidCode=employee['RfidCode'],
-                                Startdate=employee['Startdate'],
-                                Termdate=employee['Termdate'],
-                                Supervisor=employee['Supervisor'],
-                                CreatedDateUTC=employee['CreatedDateUTC'],
-                                UpdatedDateUTC=employee['UpdatedDateUTC'],
-                                DeletedDateUTC=employee['DeletedDateUTC'],
-                                ServerDateUTC=employee['ServerDateUTC'],
-                            ))
-                        if employee['ServerDateUTC'] > temp_server_date:
-                            temp_server_date = employee['ServerDateUTC']
-                        s.commit()
-                        await asyncio.sleep(0.1)
-                # Fetch all clocks from server
-                headers = {
-                    'pah-tenant-id': config.OrganisationID,
-                    'Authorization': 'Bearer ' + str(config.AccessToken)
-                }
-                req = requests.get(
-                    'https://api.planaheadgroup.com/api/v1/logs',
-                    timeout=req_timeout,
-                    headers=headers,
-                    params={'Everythingafter': str(config.LastSyncUTC)}
-                )
-                
-                if req.status_code == 200:
-                    data = req.json()
-                    for clock in data['Logs']:
-                        row = s.query(Clock).filter_by(TransactionID=clock['TransactionID']).first()
-                        if row:
-                            DB.updateModel(row, clock, Clock)
-                        else:
-                            s.add(Clock(
-                                TransactionID=clock['TransactionID'],
-                                LogType=clock['LogType'],
-                                EmployeeID=clock['People'][0]['PersonID'] if clock['People'] else '',
-                                EmployeeRFID=clock['People'][0]['PersonRFID'] if clock['People'] else '',
-                                SerialNumber='',
-                                CreatedDateUTC=clock['CreatedDateUTC'],
-                                UpdatedDateUTC=clock['UpdatedDateUTC'],
-                                DeletedDateUTC=clock['DeletedDateUTC'],
-                                ServerDateUTC=clock['ServerDateUTC'],
-                            ))
-                        if clock['ServerDateUTC'] > temp_server_date:
-                            temp_server_date = clock['ServerDateUTC']
-                        s.commit()
-                        await asyncio.sleep(0.1)
-                
-                config.LastSyncUTC = temp_server_date
-                s.commit()
-
-                clocks = s.query(Clock).filter(Clock.ServerDateUTC == 0).all()
-                date = int(datetime.datetime.now().timestamp() * 1000)
+                transferred = http.sent + http.received
+                cycle = time.monotonic()
+                config = settings.get()
+                # sync server data down to device, each list resumes from its own checkpoint
+                start = time.monotonic()
+                await DB.pull('employees', 'Employees', 'EmployeeID', 'EmployeeSyncUTC', DB.storeEmployees)
+                end = time.monotonic()
+                DB.sync_phases['employees'].observe(end - start)
+                await DB.pull('logs', 'Logs', 'TransactionID', 'LogSyncUTC', DB.storeClocks)
+                start = time.monotonic()
+                DB.sync_phases['logs'].observe(start - end)
+                settings.update(LastSyncUTC=min(config.EmployeeSyncUTC, config.LogSyncUTC))
+
+                token = await tokens.get()
                 headers = {
                     'pah-tenant-id': config.OrganisationID,
-                    'Authorization': 'Bearer ' + str(config.AccessToken)
+                    'Authorization': 'Bearer ' + token
                 }
-                for clock in clocks:
-                    temp_dict = DB.row2dict(clock)
-                    req = requests.post(
-                        'https://api.planaheadgroup.com/api/v1/clock',
-                        headers=headers,
-                        timeout=req_timeout,
-                        json=[temp_dict]
-                    )
-                    
-                    if req.status_code == 200:
-                        clock.ServerDateUTC = date
-                        clock.UpdatedDateUTC = date
-                        s.commit()
-                        print('upload clock success')
-                    else:
-                        print('upload clock failed')
-                        print(req.text)
-                
-                s.commit()
-                print('syncall finished')
+                await DB.uploadClocks(headers)
+                end = time.monotonic()
+                DB.sync_phases['upload'].observe(end - start)
+                DB.sync_phases['cycle'].observe(end - cycle)
+                DB.sync_bytes = http.sent + http.received - transferred
+                print('syncall finished, ' + str(DB.sync_bytes) + ' bytes')
             except Exception as e:
                 print('offline: ' + str(e))
+                sync_failures.inc()
+            # Ends this thread's transaction, an open read would hold back WAL checkpoints
+            Session.remove()
+            DB.sync_wake.clear()
+            try:
+                await asyncio.wait_for(DB.sync_wake.wait(), DB.sync_interval)
+            except asyncio.TimeoutError:
                 pass
-            await asyncio.sleep(60)
     
+    def unsyncedClocks():
+        '''Clocks not uploaded yet, answered from the partial index ix_clock_unsynced'''
+        return s.query(Clock).filter(Clock.ServerDateUTC == 0)
+
+    async def uploadClocks(headers):
+        '''
+            Posts pending clocks upload_batch at a time and marks the accepted ones synced
+            with one commit per batch. A batch rejected for its content is split until the bad
+            records are isolated, they stay pending and the rest go through.
+
+            A clock the server refused on its own is recorded (Rejections, RejectedUTC) and
+            from then on posted alone, once its back-off is over, so a poison record costs one
+            request per retry instead of a bisection every sync.
+        '''
+        now = int(datetime.datetime.now().timestamp() * 1000)
+        clocks = DB.unsyncedClocks().all()
+        batches = [clock for clock in clocks if not clock.Rejections]
+        batches = [batches[i:i + DB.upload_batch] for i in range(0, len(batches), DB.upload_batch)]
+        batches += [[clock] for clock in clocks if clock.Rejections and DB.retryDue(clock, now)]
+        for batch in batches:
+            (uploaded, rejected, stopped) = await DB.uploadBatch(batch, headers)
+            date = int(datetime.datetime.now().timestamp() * 1000)
+            for clock in uploaded:
+                clock.ServerDateUTC = date
+                clock.UpdatedDateUTC = date
+            for clock in rejected:
+                clock.Rejections += 1
+                clock.RejectedUTC = date
+            s.commit()
+            print('uploaded ' + str(len(uploaded)) + '/' + str(len(batch)) + ' clocks')
+            if stopped:
+                # not the records' fault (auth, server down), try again next sync
+                break
+            await asyncio.sleep(0)
+
+    def retryDue(clock, now):
+        '''Whether a clock the server refused before may be posted again'''
+        backoff = min(DB.reject_backoff_max, DB.reject_backoff_min * 2 ** (clock.Rejections - 1))
+        return now >= clock.RejectedUTC + backoff * 1000
+
+    async def uploadBatch(clocks, headers):
+        '''Returns (clocks the server accepted, clocks it refused on their own, whether to stop uploading for now)'''
+        req = await http.post(
+            DB.api + 'clock',
+            headers=headers,
+            deadline=req_timeout,
+            json=[DB.row2dict(clock) for clock in clocks]
+        )
+        if req.status_code == 200:
+            return (clocks, [], False)
+        if req.status_code not in DB.upload_rejected:
+            print('upload clock failed: ' + str(req.status_code))
+            print(req.text)
+            return ([], [], True)
+        if len(clocks) == 1:
+            print('upload clock rejected: ' + clocks[0].TransactionID)
+            print(req.text)
+            return ([], clocks, False)
+        half = len(clocks) // 2
+        (first, first_rejected, stopped) = await DB.uploadBatch(clocks[:half], headers)
+        if stopped:
+            return (first, first_rejected, True)
+        (second, second_rejected, stopped) = await DB.uploadBatch(clocks[half:], headers)
+        return (first + second, first_rejected + second_rejected, stopped)
+
+    async def pull(path, key, id_field, checkpoint, store):
+        '''
+            Pulls /api/v1/<path> page by page, starting after the checkpoint (a Config field).
+            Rows are parsed off the socket and stored sync_chunk at a time, so memory stays
+            bounded however much the server sends. The checkpoint moves on after every page,
+            an interrupted sync resumes from the last complete one.
+
+            The API pages by ServerDateUTC alone, so a full page can end partway through rows
+            sharing one. The next page asks for that ServerDateUTC again and skips the rows
+            already stored by their id_field, and the checkpoint only moves past values whose
+            rows are all in. A page holding nothing but one ServerDateUTC is asked for again
+            twice the size, until it holds the whole group.
+
+            Requests are conditional: a page asked for before is revalidated with its ETag or
+            Last-Modified, a first ask sends the checkpoint as If-Modified-Since. A 304 means
+            nothing new and costs only headers.
+        '''
+        after = getattr(settings.get(), checkpoint)
+        seen = set()  # id_field of the rows after `after` already stored
+        size = DB.page_size
+        while True:
+            token = await tokens.get()
+            headers = {
+                'pah-tenant-id': settings.get().OrganisationID,
+                'Authorization': 'Bearer ' + token
+            }
+            headers.update(DB.conditions(path, after))
+            req = await http.get(
+                DB.api + path,
+                deadline=req_timeout,
+                headers=headers,
+                params={'Everythingafter': str(after), 'PageSize': size},
+                stream=True
+            )
+            try:
+                if req.status_code == 304:
+                    return
+                if req.status_code == 401:
+                    # Revoked before it expired, the next sync gets a new one
+                    await tokens.refresh(stale=token)
+                    return
+                if req.status_code != 200:
+                    print(path + ' pull failed: ' + str(req.status_code))
+                    return
+                items = iter_array(req.iter_content(DB.read_size), key)
+                count = 0
+                latest = after  # the page's highest ServerDateUTC, maybe not all its rows yet
+                complete = after  # the highest below latest, all of its rows are in the page
+                group = set()  # id_field of the page's rows at latest
+                while True:
+                    batch = await http.call(take, items, DB.sync_chunk)
+                    if not batch:
+                        break
+                    count += len(batch)
+                    for item in batch:
+                        date = item['ServerDateUTC']
+                        if date > latest:
+                            complete = latest
+                            latest = date
+                            group = set()
+                        elif date < latest:
+                            complete = max(complete, date)
+                        if date == latest:
+                            group.add(item[id_field])
+                    fresh = [item for item in batch if item[id_field] not in seen]
+                    if fresh:
+                        await store(fresh)
+                DB.validators[path] = (after, req.headers.get('ETag'), req.headers.get('Last-Modified'))
+            finally:
+                http.finish(req)
+            if count < size:
+                # A short page is the last one, everything up to latest is in
+                if latest > getattr(settings.get(), checkpoint):
+                    settings.update(**{checkpoint: latest})
+                return
+            if complete > getattr(settings.get(), checkpoint):
+                settings.update(**{checkpoint: complete})
+            # One ServerDateUTC filled the whole page, the same request would return the same rows
+            size = size * 2 if latest - 1 == after else DB.page_size
+            after = latest - 1
+            seen = group
+
+    def conditions(path, cursor):
+        '''Conditional request headers for pulling path after cursor'''
+        (validated, etag, modified) = DB.validators.get(path, (None, None, None))
+        if validated != cursor:
+            # A different page than last time, only the checkpoint itself says anything about it
+            return {'If-Modified-Since': formatdate(cursor / 1000, usegmt=True)} if cursor else {}
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        return headers
+
+    async def storeEmployees(items):
+        employees = [DB.employeeRow(employee) for employee in items]
+        await DB.bulkUpsert(Employee, 'EmployeeID', DB.employee_columns, employees)
+        for employee in employees:
+            tag_index.sync_employee(employee)
+        return employees
+
+    async def storeClocks(items):
+        clocks = [DB.clockRow(clock) for clock in items]
+        await DB.bulkUpsert(Clock, 'TransactionID', DB.clock_columns, clocks)
+        return clocks
+
+    def employeeRow(employee):
+        row = {'EmployeeID': employee['EmployeeID']}
+        for column in DB.employee_columns:
+            row[column] = employee[column]
+        return row
+
+    def clockRow(clock):
+        row = {
+            'TransactionID': clock['TransactionID'],
+            'EmployeeID': clock['People'][0]['PersonID'] if clock['People'] else '',
+            'EmployeeRFID': clock['People'][0]['PersonRFID'] if clock['People'] else '',
+            'SerialNumber': '',
+        }
+        for column in DB.clock_columns:
+            row[column] = clock[column]
+        return row
+
+    async def bulkUpsert(model, key, columns, rows):
+        '''
+            INSERT ... ON CONFLICT(key) DO UPDATE for a whole pulled page, executemany in
+            chunks of sync_chunk rows. Yields to the event loop by elapsed time rather than
+            per row, committing first: a write transaction held across the yield would make
+            the journal's group commit, and any other writer on the loop thread such as
+            settings.update, wait on the lock (the latter blocking the loop it waits for).
+            Safe to cut short, the upsert is idempotent and the pull's checkpoint only moves on
+            once the whole page is stored.
+        '''
+        if not rows:
+            return
+        stmt = insert(model.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={column: stmt.excluded[column] for column in columns}
+        )
+        last_yield = time.monotonic()
+        try:
+            for i in range(0, len(rows), DB.sync_chunk):
+                s.execute(stmt, rows[i:i + DB.sync_chunk])
+                if time.monotonic() - last_yield > DB.sync_slice:
+                    s.commit()
+                    await asyncio.sleep(0)
+                    last_yield = time.monotonic()
+            s.commit()
+        except Exception:
+            s.rollback()
+            raise
+
     def updateModel(row, new, model):
         columns = model.__table__.columns
         for column in columns:
@@ -237,6 +543,15 @@ class DB():
     def row2dict(row):
         d = {}
         for column in row.__table__.columns:
+            if column.name in DB.unsent_columns:
+                continue
             d[column.name] = str(getattr(row, column.name))
 
-        return d
\ No newline at end of file
+        return d
+
+
+clock_journal = ClockJournal(journal_name, DB.commitClocks)
+DB.journal = clock_journal
+metrics.expose('rfid_gate_sync_bytes', 'gauge', 'Bytes on the wire of the last complete sync cycle', lambda: DB.sync_bytes)
+metrics.expose('rfid_gate_clocks_unflushed', 'gauge', 'Journaled clocks not yet committed to SQLite', lambda: len(clock_journal.pending))
+metrics.expose('rfid_gate_tags_indexed', 'gauge', 'Active tags in the in-memory index', lambda: len(tag_index.tags))
@@ -3,10 +3,9 @@ import random
 import math
 import threading
 import asyncio
-import datetime
 
-from models import Employee
 from db_utils import DB
+from access_rules import rules
 
 
 class HX711:
@@ -381,22 +380,16 @@ class RFID_UTIL(object):
     
     async def checkTag(self, uid, direction):
         print('checkTag')
-        res = DB.getFilterObjects(Employee, f"RfidCode == '{uid}' AND Termdate is NULL")
-        if len(res) == 1:
-            date = int(datetime.datetime.now().timestamp() * 1000)
-            if res[0]['LogDateUTC'] + 30000 > date:
-                print('unauthorized')
-            elif direction == 1 and res[0]['LogType'] == 3:
-                print('unauthorized')
-            elif direction == 2 and res[0]['LogType'] == 4:
-                print('unauthorized')
-            else:
-                # await self.openRelay(direction)
-                # await self.waitEOT(uid, direction)
-                print('access allowed')
-        elif len(res) == 0:
+        res = DB.getTag(uid)
+        if len(res) != 1:
             print('unauthorized')
-        await self.parent.restartRfidLoop()
+            return False
+        (allowed, reason) = rules.decide(res[0], direction)
+        if not allowed:
+            print('unauthorized: ' + reason)
+        else:
+            print('access allowed')
+        return allowed
 
     def request(self):
         # print('request')
@@ -404,7 +397,7 @@ class RFID_UTIL(object):
 
     def anticoll(self):
         # print('anticoll')
-        return (False, 'uid1')
+        return (False, [0x75, 0x69, 0x64, 0x31, 0x75 ^ 0x69 ^ 0x64 ^ 0x31])
 
     def select_tag(self):
         print('select_tag')
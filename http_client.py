@@ -0,0 +1,84 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+# gzip and deflate, plus br when the brotli package is installed
+from urllib3.util.request import ACCEPT_ENCODING
+
+from metrics import metrics
+
+
+def header_bytes(headers):
+    return sum(len(name) + len(value) + 4 for name, value in headers.items()) + 2
+
+
+class HttpClient():
+    '''
+        Shared HTTP client for sync and auth. One requests.Session keeps connections to the
+        API alive between calls, and every request runs on a small thread pool so the event
+        loop (and the readers with it) never waits on the network.
+
+        deadline -- seconds for the whole call. The awaiting coroutine gets
+        asyncio.TimeoutError when it passes, and can be cancelled at any time. The worker
+        thread finishes in the background within the socket timeout.
+
+        sent and received count the bytes on the wire (bodies as transferred, so compressed,
+        and headers). A stream=True response is counted when it is passed to finish().
+    '''
+    def __init__(self, workers=2, timeout=10):
+        self.timeout = timeout
+        self.sent = 0
+        self.received = 0
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+
+    async def request(self, method, url, deadline=None, **kwargs):
+        deadline = deadline or self.timeout
+        kwargs.setdefault('timeout', deadline)
+        call = functools.partial(self.session.request, method, url, **kwargs)
+        response = await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(self.executor, call), deadline)
+        self.count_request(response)
+        if not kwargs.get('stream'):
+            self.count_response(response)
+        return response
+
+    def finish(self, response):
+        '''Closes a stream=True response and counts what was read of it'''
+        response.close()
+        self.count_response(response)
+
+    def count_request(self, response):
+        request = response.request
+        self.sent += len(request.method) + len(request.url) + 12 + header_bytes(request.headers)
+        if request.body is not None:
+            self.sent += len(request.body)
+
+    def count_response(self, response):
+        self.received += 17 + len(response.reason or '') + header_bytes(response.headers)
+        # raw.tell() is what came off the socket, before any gzip/br decoding
+        self.received += response.raw.tell() if response.raw is not None else len(response.content)
+
+    async def call(self, func, *args):
+        '''Runs a blocking call on the http threads, e.g. reading a streamed body'''
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+        self.executor.shutdown(wait=False)
+
+
+http = HttpClient()
+metrics.expose('rfid_gate_http_sent_bytes_total', 'counter', 'Bytes sent to the API, headers included', lambda: http.sent)
+metrics.expose('rfid_gate_http_received_bytes_total', 'counter', 'Bytes received from the API as transferred, headers included', lambda: http.received)
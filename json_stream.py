@@ -0,0 +1,88 @@
+'''
+    Incremental parsing of the API's list responses, e.g. {"Employees": [{...}, {...}]}.
+    iter_array yields the array's items one by one while the body is still being read, so
+    only the item being parsed and one chunk of the body are held in memory. Standard
+    library only, each item is decoded with json's own raw_decode.
+'''
+import re
+import json
+import codecs
+
+decoder = json.JSONDecoder()
+whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def iter_array(chunks, key):
+    '''
+        Yields the items of the array stored under key in the top-level object.
+        chunks -- iterable of bytes, e.g. response.iter_content(65536)
+    '''
+    chunks = iter(chunks)
+    text = codecs.getincrementaldecoder('utf-8')()
+    start = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+    buffer = ''
+    ended = False
+
+    def more():
+        nonlocal buffer, ended
+        for chunk in chunks:
+            if chunk:
+                buffer += text.decode(chunk)
+                return True
+        buffer += text.decode(b'', final=True)
+        ended = True
+        return False
+
+    # Find the opening bracket, keeping only a tail long enough to hold a split match
+    while True:
+        match = start.search(buffer)
+        if match:
+            pos = match.end()
+            break
+        if len(buffer) > 65536:
+            buffer = buffer[-1024:]
+        if not more():
+            raise ValueError('no "' + key + '" array in response')
+
+    while True:
+        pos = whitespace.match(buffer, pos).end()
+        if pos >= len(buffer):
+            if not more():
+                raise ValueError('response ended inside "' + key + '"')
+            continue
+        if buffer[pos] == ']':
+            return
+        if buffer[pos] == ',':
+            pos += 1
+            continue
+        try:
+            (item, end) = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            # Most likely the item is cut off at the end of the buffer
+            if ended:
+                raise
+            buffer = buffer[pos:]
+            pos = 0
+            more()
+            continue
+        if end == len(buffer) and not ended:
+            # A number at the very end may continue in the next chunk
+            buffer = buffer[pos:]
+            pos = 0
+            more()
+            continue
+        yield item
+        pos = end
+        if pos > 65536:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def take(items, n):
+    '''Up to n items from the iterator, an empty list once it is exhausted'''
+    rows = []
+    for item in items:
+        rows.append(item)
+        if len(rows) == n:
+            break
+    return rows
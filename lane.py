@@ -0,0 +1,113 @@
+import time
+import asyncio
+
+from metrics import metrics
+
+from tap_cache import TapCache
+from uid import UID
+
+
+class Lane():
+    '''
+        One reader/relay/EOT gate running its own pipeline, so a person walking through
+        one gate doesn't leave the others deaf:
+
+            idle -> reading -> authorizing -> open -> awaiting EOT -> idle
+
+        index -- which reader, relay and EOT pin of the gate this lane drives
+        direction -- what a pass through it is, 1 in or 2 out. Any number of lanes may share one.
+
+        The gate object does the actual work: checkTag(uid, direction) returns whether the
+        tag (a uid.UID) may pass, openRelay(lane), waitEOT(uid, lane) and failBeep().
+        The SPI bus is shared through the spi_bus arbiter. Run it under a Supervisor.
+
+        Every tag in the field is identified in one pass, each one a tap of its own, and
+        HALTed so it stays quiet while it rests on the reader. The same UID read again
+        within repeat_ttl seconds is counted in repeats and otherwise ignored, without a
+        second checkTag, relay or beep.
+
+        Each stage is timed into rfid_gate_tap_stage_seconds: inventory (REQA, anticollision,
+        SELECT and HALT of every tag), check (checkTag), relay (openRelay), eot (waitEOT,
+        including DB.addClock) and refuse (failBeep).
+    '''
+    state_idle = 'idle'
+    state_reading = 'reading'
+    state_authorizing = 'authorizing'
+    state_open = 'open'
+    state_eot = 'awaiting EOT'
+
+    repeat_ttl = 3
+    repeat_size = 32
+
+    def __init__(self, gate, pool, index, direction):
+        self.gate = gate
+        self.pool = pool
+        self.index = index
+        self.direction = direction
+        self.state = self.state_idle
+        self.taps = 0
+        self.repeats = 0
+        self.recent = TapCache(self.repeat_ttl, self.repeat_size)
+        lane = str(index)
+        stage = lambda name: metrics.histogram('rfid_gate_tap_stage_seconds', 'Time spent in each stage of a tap', lane=lane, stage=name)
+        self.inventory_time = stage('inventory')
+        self.check_time = stage('check')
+        self.relay_time = stage('relay')
+        self.eot_time = stage('eot')
+        self.refuse_time = stage('refuse')
+        metrics.expose('rfid_gate_taps_total', 'counter', 'Tags decided on', lambda: self.taps, lane=lane)
+        metrics.expose('rfid_gate_repeats_total', 'counter', 'Reads of a tag already decided on within repeat_ttl', lambda: self.repeats, lane=lane)
+
+    def __repr__(self):
+        return 'Lane(' + str(self.index) + ', ' + str(self.direction) + ', ' + self.state + ')'
+
+    async def restart(self):
+        '''Puts the reader back in a known state after a failed pass'''
+        self.state = self.state_idle
+        await self.pool.readers[self.index].init()
+
+    async def step(self):
+        '''One full pass through the pipeline, from waiting for tags back to idle'''
+        self.state = self.state_idle
+        reader = await self.pool.wait_for(self.index)
+        try:
+            self.state = self.state_reading
+            start = time.monotonic()
+            # The tags answered wait_for's REQA and are READY, another REQA would send them back to IDLE
+            cards = await reader.inventory(ready=True)
+            self.inventory_time.observe(time.monotonic() - start)
+            if not cards:
+                print('anticoll error')
+                return
+            for (uid, sak) in cards:
+                await self.tap(UID(uid))
+        finally:
+            self.state = self.state_idle
+
+    async def tap(self, uid):
+        '''Decides on one tag, already HALTed by the inventory'''
+        if self.recent.get(uid) is not None:
+            self.repeats += 1
+            return
+        print('UID = ' + str(uid))
+
+        self.state = self.state_authorizing
+        self.taps += 1
+        start = time.monotonic()
+        allowed = await self.gate.checkTag(uid, self.direction)
+        end = time.monotonic()
+        self.check_time.observe(end - start)
+        self.recent.put(uid, allowed)
+        if allowed:
+            self.state = self.state_open
+            start = end
+            await self.gate.openRelay(self)
+            end = time.monotonic()
+            self.relay_time.observe(end - start)
+            self.state = self.state_eot
+            await self.gate.waitEOT(uid, self)
+            self.eot_time.observe(time.monotonic() - end)
+        else:
+            await self.gate.failBeep()
+            self.refuse_time.observe(time.monotonic() - end)
+            await asyncio.sleep(0.5)
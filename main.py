@@ -8,20 +8,40 @@ except:
     from emulated import RFID_UTIL
 from db_utils import DB
 from app_auth import Issuer
+from token_manager import tokens
+from metrics import metrics
+from supervisor import Supervisor
 
 
 class mainLoop():
+    # Seconds between authorization attempts while the API can't be reached, doubling up to the max
+    auth_backoff_min = 1
+    auth_backoff_max = 300
+
     def __init__(self):
         self.rdr = RFID_UTIL(self)
         self.issuer = Issuer()
+        # Restarted after a back-off if they die, like the reader lanes
+        self.supervisors = [Supervisor('token refresh', tokens.run), Supervisor('sync', DB.asyncAll)]
     
-    async def restartRfidLoop(self):
+    async def sync(self):
         '''
-        Here you can control when the loop needs to restart
+        Authorize then keep syncing, runs alongside the readers so the network never holds up a tap
         '''
-        print('restartRfidLoop')
-        await asyncio.create_task(self.rdr.wait_for_tag())
-    
+        await self.authorize()
+        await asyncio.gather(*[supervisor.run() for supervisor in self.supervisors])
+
+    async def authorize(self):
+        '''Issuer.run until it gets through, e.g. the device booted offline'''
+        delay = self.auth_backoff_min
+        while True:
+            try:
+                return await self.issuer.run()
+            except Exception as e:
+                print('authorization failed: ' + repr(e) + ', retrying in ' + str(delay) + 's')
+            await asyncio.sleep(delay)
+            delay = min(self.auth_backoff_max, delay * 2)
+
     def end_read(self):
         global run
         print("\nCtrl+C captured, ending read.")
@@ -33,9 +53,12 @@ async def main():
         main_loop = mainLoop()
         
         signal.signal(signal.SIGINT, main_loop.end_read)  # Supposed to fire off when Ctrl+C is pressed :?
+        DB.openJournal()
+        DB.loadIndex()
         print("Ready for tag")
-        await asyncio.create_task(main_loop.issuer.run())
-        asyncio.create_task(DB.asyncAll())
+        asyncio.create_task(main_loop.sync())
+        asyncio.create_task(DB.journal.run())
+        asyncio.create_task(metrics.serve())
         await asyncio.create_task(main_loop.rdr.wait_for_tag())
     except Exception as e:
         print(str(e))
@@ -0,0 +1,165 @@
+'''
+    Counters and fixed-bucket histograms for the tap path and the sync, served as
+    Prometheus text on a local HTTP port:
+
+        curl http://127.0.0.1:9105/metrics
+
+    Timing is done by the caller with time.monotonic() around a stage, observe() is a
+    bisect and two additions, so an instrumented tap costs a few microseconds in total.
+    Stats other modules already keep (Lane.taps, Supervisor.errors, http.sent, ...) are
+    not copied, expose() reads them when the endpoint is scraped.
+'''
+import asyncio
+from bisect import bisect_left
+
+# Seconds, from an IRQ wake-up to a gate that stays open for the whole EOT timeout
+tap_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+sync_buckets = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def label_text(labels):
+    if not labels:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels]
+    return '{' + ','.join(name + '="' + value + '"' for name, value in escaped) + '}'
+
+
+def number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter():
+    __slots__ = ('labels', 'value')
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def lines(self, name):
+        return [name + label_text(self.labels) + ' ' + number(self.value)]
+
+
+class Histogram():
+    __slots__ = ('labels', 'bounds', 'counts', 'sum')
+
+    def __init__(self, labels, bounds):
+        self.labels = labels
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # the last one is +Inf
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def lines(self, name):
+        lines = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            lines.append(name + '_bucket' + label_text(self.labels + (('le', number(bound)),)) + ' ' + str(total))
+        lines.append(name + '_sum' + label_text(self.labels) + ' ' + number(self.sum))
+        lines.append(name + '_count' + label_text(self.labels) + ' ' + str(total))
+        return lines
+
+
+class Exposed():
+    '''A value owned by some other object, read at scrape time'''
+    __slots__ = ('labels', 'read')
+
+    def __init__(self, labels, read):
+        self.labels = labels
+        self.read = read
+
+    def lines(self, name):
+        return [name + label_text(self.labels) + ' ' + number(self.read())]
+
+
+class Metrics():
+    '''
+        Registry of metric families, each a name, a type, a help line and one series per
+        label set. Asking for a series that exists returns it, so a restarted Lane keeps
+        counting where the old one stopped.
+    '''
+    host = '127.0.0.1'
+    port = 9105
+
+    def __init__(self):
+        self.families = {}  # name -> (type, help, {labels: series})
+
+    def series(self, name, kind, help, labels, make):
+        family = self.families.setdefault(name, (kind, help, {}))
+        if family[0] != kind:
+            raise ValueError(name + ' is a ' + family[0] + ', not a ' + kind)
+        labels = tuple(sorted(labels.items()))
+        if labels not in family[2]:
+            family[2][labels] = make(labels)
+        return family[2][labels]
+
+    def counter(self, name, help, **labels):
+        return self.series(name, 'counter', help, labels, Counter)
+
+    def histogram(self, name, help, buckets=tap_buckets, **labels):
+        return self.series(name, 'histogram', help, labels, lambda labels: Histogram(labels, buckets))
+
+    def expose(self, name, kind, help, read, **labels):
+        '''kind -- 'counter' or 'gauge', read() returns the current value'''
+        labels = tuple(sorted(labels.items()))
+        family = self.families.setdefault(name, (kind, help, {}))
+        # Replaces an earlier reader of the same series, e.g. of a recreated object
+        family[2][labels] = Exposed(labels, read)
+
+    def render(self):
+        lines = []
+        for name, (kind, help, series) in self.families.items():
+            lines.append('# HELP ' + name + ' ' + help)
+            lines.append('# TYPE ' + name + ' ' + kind)
+            for one in series.values():
+                try:
+                    lines += one.lines(name)
+                except Exception as e:
+                    print('metric ' + name + ' failed: ' + repr(e))
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host=None, port=None):
+        '''Serves GET /metrics until cancelled, bound to localhost by default'''
+        try:
+            server = await asyncio.start_server(self.handle, host or self.host, port or self.port)
+        except OSError as e:
+            print('metrics endpoint not started: ' + str(e))
+            return
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # The headers aren't needed, read them so the client sees a clean close
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                (status, body) = ('200 OK', self.render().encode())
+            else:
+                (status, body) = ('404 Not Found', b'not found\n')
+            writer.write((
+                'HTTP/1.0 ' + status + '\r\n'
+                'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                'Content-Length: ' + str(len(body)) + '\r\n'
+                'Connection: close\r\n\r\n'
+            ).encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+metrics = Metrics()
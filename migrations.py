@@ -0,0 +1,88 @@
+'''
+    Schema migrations for rfid_gate.db. The schema version lives in SQLite's
+    PRAGMA user_version, every migration with a higher version is applied in order, each in
+    its own transaction. Add new steps to the end of MIGRATIONS, never edit applied ones.
+'''
+from sqlalchemy import text
+
+
+def create_tables(conn, metadata):
+    # Databases from before migrations existed already have these, checkfirst skips them
+    metadata.create_all(bind=conn, checkfirst=True)
+
+
+def add_column(table, column, ddl):
+    '''Step adding a column, skipped when create_tables already made it from the models'''
+    def step(conn, metadata):
+        columns = [row[1] for row in conn.execute(text('PRAGMA table_info("' + table + '")'))]
+        if column not in columns:
+            conn.execute(text('ALTER TABLE "' + table + '" ADD COLUMN ' + column + ' ' + ddl))
+    return step
+
+
+MIGRATIONS = [
+    (1, 'create tables', [create_tables]),
+    (2, 'indexes for tag lookups, sync upserts and pending uploads', [
+        'CREATE INDEX IF NOT EXISTS ix_employee_RfidCode ON employee (RfidCode)',
+        # Partial: only the clocks still waiting for upload, stays tiny on devices with years of history
+        'CREATE INDEX IF NOT EXISTS ix_clock_unsynced ON "Clock" (ServerDateUTC) WHERE ServerDateUTC = 0',
+    ]),
+    (3, 'sync checkpoints per pulled list', [
+        add_column('config', 'EmployeeSyncUTC', 'INTEGER NOT NULL DEFAULT 0'),
+        add_column('config', 'LogSyncUTC', 'INTEGER NOT NULL DEFAULT 0'),
+        'UPDATE config SET EmployeeSyncUTC = LastSyncUTC, LogSyncUTC = LastSyncUTC',
+    ]),
+    (4, 'upload rejections per clock', [
+        add_column('Clock', 'Rejections', 'INTEGER NOT NULL DEFAULT 0'),
+        add_column('Clock', 'RejectedUTC', 'INTEGER NOT NULL DEFAULT 0'),
+    ]),
+]
+
+# The hot queries and the parameters to plan them with, see check_query_plans
+HOT_QUERIES = {
+    'employee by RfidCode': ('SELECT * FROM employee WHERE RfidCode = :p', {'p': ''}),
+    'employee by EmployeeID': ('SELECT * FROM employee WHERE EmployeeID = :p', {'p': ''}),
+    'unsynced clocks': ('SELECT * FROM "Clock" WHERE "Clock"."ServerDateUTC" = 0', {}),
+    'clock by TransactionID': ('SELECT * FROM "Clock" WHERE TransactionID = :p', {'p': ''}),
+}
+
+
+def schema_version(conn):
+    return conn.execute(text('PRAGMA user_version')).scalar()
+
+
+def migrate(engine, metadata):
+    '''Brings the database up to the latest schema version, returns that version'''
+    with engine.connect() as conn:
+        version = schema_version(conn)
+    for (target, description, steps) in MIGRATIONS:
+        if target <= version:
+            continue
+        with engine.begin() as conn:
+            for step in steps:
+                if callable(step):
+                    step(conn, metadata)
+                else:
+                    conn.execute(text(step))
+            conn.execute(text('PRAGMA user_version = ' + str(int(target))))
+        print('migrated rfid_gate.db to version ' + str(target) + ': ' + description)
+        version = target
+    return version
+
+
+def explain(conn, query, params):
+    return [row[-1] for row in conn.execute(text('EXPLAIN QUERY PLAN ' + query), params)]
+
+
+def check_query_plans(engine):
+    '''
+        Returns {query name: plan} for every hot query that SQLite would answer with a full
+        table scan, empty when all of them use an index.
+    '''
+    scans = {}
+    with engine.connect() as conn:
+        for name, (query, params) in HOT_QUERIES.items():
+            plan = explain(conn, query, params)
+            if any(step.startswith('SCAN') and 'USING' not in step for step in plan):
+                scans[name] = plan
+    return scans
@@ -1,7 +1,8 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, CHAR, Float, ForeignKey, func, TypeDecorator, DateTime, Boolean, create_engine, MetaData, Sequence
+from sqlalchemy import Column, Integer, String, CHAR, Float, ForeignKey, func, TypeDecorator, DateTime, Boolean, MetaData, Sequence
 from sqlalchemy.orm import relationship
-import os
+from migrations import migrate
+from database import engine
 import uuid
 import datetime
 import string
@@ -47,6 +48,9 @@ class Config(Base):
     ExpiredToken = Column(Integer, nullable=False, default=0)
     LastAuthDateUTC = Column(Integer, nullable=False, default=0)
     LastSyncUTC = Column(Integer, nullable=False, default=0)
+    # Where the employees and logs pulls resume, LastSyncUTC is the older of the two
+    EmployeeSyncUTC = Column(Integer, nullable=False, default=0)
+    LogSyncUTC = Column(Integer, nullable=False, default=0)
     CreatedDateUTC = Column(Integer, default=int(datetime.datetime.now().timestamp() * 1000))
     UpdatedDateUTC = Column(Integer, default=int(datetime.datetime.now().timestamp() * 1000), onupdate=int(datetime.datetime.now().timestamp() * 1000))
     DeletedDateUTC = Column(Integer, nullable=False, default=0)
@@ -80,11 +84,10 @@ class Clock(Base):
     UpdatedDateUTC = Column(Integer, default=int(datetime.datetime.now().timestamp() * 1000), onupdate=int(datetime.datetime.now().timestamp() * 1000))
     DeletedDateUTC = Column(Integer, nullable=False, default=0)
     ServerDateUTC = Column(Integer, nullable=False, default=0)
+    # Local only: times the server refused this clock on its own, and when it last did
+    Rejections = Column(Integer, nullable=False, default=0)
+    RejectedUTC = Column(Integer, nullable=False, default=0)
 
 
-dir_name = os.path.join(os.path.dirname(os.path.realpath(__file__)), "rfid_gate.db")
-engine = create_engine("sqlite:///"+dir_name)
-# Create tables if they don't exist
-Config.__table__.create(bind=engine, checkfirst=True)
-Employee.__table__.create(bind=engine, checkfirst=True)
-Clock.__table__.create(bind=engine, checkfirst=True)
\ No newline at end of file
+# Create tables and indexes if they don't exist, upgrade older databases
+migrate(engine, Base.metadata)
@@ -1,5 +1,63 @@
-import spidev
-import RPi.GPIO as GPIO
+import time
+import threading
+
+try:
+    import spidev
+    import RPi.GPIO as GPIO
+except ImportError:
+    # Allows the driver to be used with a simulated transport (see rc522_sim.py)
+    spidev = None
+    GPIO = None
+
+
+def cascade_frames(uid):
+    '''
+        The anticollision frames of a 4, 7 or 10 byte UID, one per cascade level: four
+        bytes (0x88 cascade tag first when the UID goes on) followed by their BCC
+    '''
+    frames = []
+    rest = list(uid)
+    while len(rest) > 4:
+        frames.append([0x88] + rest[:3])
+        rest = rest[3:]
+    frames.append(rest)
+    return [frame + [frame[0] ^ frame[1] ^ frame[2] ^ frame[3]] for frame in frames]
+
+
+class SpiTransport():
+    '''
+        Real MFRC522 on the Pi SPI bus. The SDA pin is driven as a GPIO chip select
+        so that more readers can share SCK/MOSI/MISO than there are CE pins.
+    '''
+    def __init__(self, pin_sda=8, pin_irq=24, pin_rst=25, device=0, bus=0, speed=1000000):
+        self.pin_sda = pin_sda
+        self.pin_irq = pin_irq
+        self.pin_rst = pin_rst
+
+        self.spi = spidev.SpiDev()
+        self.spi.open(bus, device)
+        self.spi.max_speed_hz = speed
+
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(self.pin_rst, GPIO.OUT)
+        GPIO.setup(self.pin_irq, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        GPIO.output(self.pin_rst, 1)
+        GPIO.setup(self.pin_sda, GPIO.OUT)
+        GPIO.output(self.pin_sda, 1)
+
+    def set_irq_callback(self, callback):
+        GPIO.add_event_detect(self.pin_irq, GPIO.FALLING, callback=callback)
+
+    def xfer2(self, data):
+        if self.pin_sda != 0:
+            GPIO.output(self.pin_sda, 0)
+        r = self.spi.xfer2(data)
+        if self.pin_sda != 0:
+            GPIO.output(self.pin_sda, 1)
+        return r
+
+    def close(self):
+        self.spi.close()
 
 
 class RC522():
@@ -26,56 +84,167 @@ class RC522():
     act_anticl = 0x93
     act_select = 0x93
     act_end = 0x50
+    # SEL of cascade levels 1-3, a 4 byte UID needs one, 7 bytes two and 10 bytes three
+    cascade_levels = (0x93, 0x95, 0x97)
+    # Most tags inventory() resolves in one go
+    inventory_limit = 8
+    # Chip timer reload in 0.5ms ticks (prescaler set in init): the normal one covers
+    # MIFARE read/write, the quick one frames a tag answers within ~0.1ms or never,
+    # like HLTA and the REQA looking for more tags
+    timer_reload = 30
+    quick_reload = 3
 
     reg_tx_control = 0x14
     length = 16
+    fifo_size = 64
     speed = 1000000
 
+    # Fill and drain the FIFO with one multi-byte SPI frame instead of one frame per byte
+    burst = True
+
+    # Configuration registers only ever changed by the driver, these can be served from the
+    # shadow cache. CommIrq, FIFO, Status, Control (RxLastBits), Coll and Command are changed
+    # by the chip itself and must always be read from the bus.
+    shadowed = (0x02, 0x03, 0x0D, 0x11, 0x14, 0x15, 0x2A, 0x2B, 0x2C, 0x2D)
+
+    # Hard deadline for a command or CRC to signal completion on the IRQ line. The chip
+    # timer (TModeReg/TReloadReg set in init) gives up on a silent card after ~15ms.
+    irq_timeout = 0.05
+    # Missed IRQs (deadline hit although the chip was done) before falling back to polling
+    irq_miss_limit = 3
+
     authed = False
+    # Whether the last card_write hit a bit collision, its data is valid up to CollReg
+    collision = False
 #  pin_sda=7, pin_irq=1, pin_rst=0
-    def __init__(self, irq_callback, pin_sda=8, pin_irq=24, pin_rst=25, device=0, bus=0):
+    def __init__(self, irq_callback, pin_sda=8, pin_irq=24, pin_rst=25, device=0, bus=0, transport=None, shadow=False, use_irq=True):
+        '''
+            transport -- object with xfer2(data) and set_irq_callback(callback), defaults to
+            SpiTransport on the given pins. Pass a rc522_sim.MFRC522Sim to run without hardware.
+            shadow -- keep a write-through cache of the shadowed registers so set_bitmask and
+            clear_bitmask on them cost a single SPI write
+            use_irq -- wait for command and CRC completion on the IRQ line instead of polling
+        '''
         self.pin_sda = pin_sda
         self.pin_irq = pin_irq
         self.pin_rst = pin_rst
         self.irq_callback = irq_callback
+        self.shadow = {} if shadow else None
+        self.use_irq = use_irq
+        self.irq_misses = 0
+        self.irq = threading.Event()
 
-        self.spi = spidev.SpiDev()
-        self.spi.open(bus, device)
-        self.spi.max_speed_hz = self.speed
+        if transport is None:
+            transport = SpiTransport(pin_sda, pin_irq, pin_rst, device, bus, self.speed)
+        self.transport = transport
+        self.transport.set_irq_callback(self.on_irq)
+
+        # Reusable frames for burst FIFO access, read frames are indexed by byte count
+        self.fifo_write_frame = [(0x09 << 1) & 0x7E]
+        self.fifo_read_frames = [[((0x09 << 1) & 0x7E) | 0x80] * n + [0] for n in range(self.fifo_size + 1)]
 
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.pin_rst, GPIO.OUT)
-        GPIO.setup(self.pin_irq, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.add_event_detect(self.pin_irq, GPIO.FALLING,callback=self.irq_callback)
-        GPIO.output(self.pin_rst, 1)
-        GPIO.setup(self.pin_sda, GPIO.OUT)
-        GPIO.output(self.pin_sda, 1)
-        
         self.init()
         
     def init(self):
         self.reset()
         self.dev_write(0x2A, 0x8D)
         self.dev_write(0x2B, 0x3E)
-        self.dev_write(0x2D, 30)
-        self.dev_write(0x2C, 0)
+        self.set_timer(self.timer_reload)
         self.dev_write(0x15, 0x40)
         self.dev_write(0x11, 0x3D)
         self.set_antenna(True)
 
+    def set_timer(self, reload):
+        self.dev_write(0x2C, reload >> 8)
+        self.dev_write(0x2D, reload & 0xFF)
+
+    def on_irq(self, pin):
+        '''
+            Runs in the GPIO thread on every falling edge of the IRQ line. Wakes up wait_irq
+            and passes the edge on to the owner of the reader.
+        '''
+        self.irq.set()
+        self.irq_callback(pin)
+
+    def wait_irq(self, address, mask, count):
+        '''
+            Waits until one of the mask bits is set in CommIrq (0x04) or DivIrq (0x05).
+            The matching interrupt sources must be the only ones enabled and self.irq must be
+            cleared before the command is started, the bus then stays quiet until the IRQ line
+            fires or irq_timeout passes. Without IRQ the register is polled up to count times.
+            Returns (done, last register value)
+        '''
+        if self.use_irq:
+            deadline = time.monotonic() + self.irq_timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                fired = remaining > 0 and self.irq.wait(remaining)
+                self.irq.clear()
+                n = self.dev_read(address)
+                if n & mask:
+                    if fired:
+                        self.irq_misses = 0
+                    else:
+                        self.irq_misses += 1
+                        if self.irq_misses >= self.irq_miss_limit:
+                            print('IRQ not firing on pin ' + str(self.pin_irq) + ', polling instead')
+                            self.use_irq = False
+                    return (True, n)
+                if not fired:
+                    return (False, n)
+
+        i = count
+        while True:
+            n = self.dev_read(address)
+            i -= 1
+            if n & mask:
+                return (True, n)
+            if i == 0:
+                return (False, n)
+
     def spi_transfer(self, data):
-        if self.pin_sda != 0:
-            GPIO.output(self.pin_sda, 0)
-        r = self.spi.xfer2(data)
-        if self.pin_sda != 0:
-            GPIO.output(self.pin_sda, 1)
-        return r
+        return self.transport.xfer2(data)
 
     def dev_write(self, address, value):
+        value &= 0xFF
         self.spi_transfer([(address << 1) & 0x7E, value])
+        if self.shadow is not None and address in self.shadowed:
+            self.shadow[address] = value
 
     def dev_read(self, address):
-        return self.spi_transfer([((address << 1) & 0x7E) | 0x80, 0])[1]
+        if self.shadow is not None and address in self.shadow:
+            return self.shadow[address]
+        value = self.spi_transfer([((address << 1) & 0x7E) | 0x80, 0])[1]
+        if self.shadow is not None and address in self.shadowed:
+            self.shadow[address] = value
+        return value
+
+    def dev_read_burst(self, addresses):
+        '''
+            Reads several registers in one SPI frame, the MFRC522 clocks out the value of
+            each address while the next one is being sent.
+        '''
+        frame = [((address << 1) & 0x7E) | 0x80 for address in addresses]
+        frame.append(0)
+        return self.spi_transfer(frame)[1:]
+
+    def fifo_write(self, data):
+        if not self.burst:
+            for i in range(len(data)):
+                self.dev_write(0x09, data[i])
+            return
+        if not data:
+            return
+        frame = self.fifo_write_frame
+        frame[1:] = data
+        self.spi_transfer(frame)
+
+    def fifo_read(self, n):
+        if not self.burst:
+            return [self.dev_read(0x09) for i in range(n)]
+        if n == 0:
+            return []
+        return self.spi_transfer(self.fifo_read_frames[n])[1:]
 
     def set_bitmask(self, address, mask):
         current = self.dev_read(address)
@@ -93,7 +262,8 @@ class RC522():
         else:
             self.clear_bitmask(self.reg_tx_control, 0x03)
 
-    def card_write(self, command, data):
+    def card_write(self, command, data, expect_timeout=False):
+        '''expect_timeout -- a tag not answering is normal (HLTA, probing REQA), don't print E1'''
         back_data = []
         back_length = 0
         error = False
@@ -101,6 +271,7 @@ class RC522():
         irq_wait1 = 0x00
         last_bits = None
         n = 0
+        self.collision = False
 
         if command == self.mode_auth:
             irq = 0x12
@@ -109,39 +280,52 @@ class RC522():
             irq = 0x77
             irq_wait1 = 0x30
 
-        self.dev_write(0x02, irq | 0x80)
-        self.clear_bitmask(0x04, 0x80)
-        self.set_bitmask(0x0A, 0x80)
+        # Done when the command finishes or the chip timer runs out
+        irq_done = irq_wait1 | 0x01
+
+        if self.use_irq:
+            # Only the completion sources may drive the IRQ line, any other one would hold
+            # it low and swallow the edge we wait for
+            self.dev_write(0x02, irq_done | 0x80)
+        else:
+            self.dev_write(0x02, irq | 0x80)
+        # CommIrq and FIFOLevel act on the bits written, no need to read them first:
+        # 0x7F clears every interrupt request, 0x80 flushes the FIFO
+        self.dev_write(0x04, 0x7F)
+        self.dev_write(0x0A, 0x80)
         self.dev_write(0x01, self.mode_idle)
 
-        for i in range(len(data)):
-            self.dev_write(0x09, data[i])
+        self.fifo_write(data)
 
+        self.irq.clear()
         self.dev_write(0x01, command)
 
         if command == self.mode_transrec:
             self.set_bitmask(0x0D, 0x80)
 
-        i = 2000
-        while True:
-            n = self.dev_read(0x04)
-            i -= 1
-            if ~((i != 0) and ~(n & 0x01) and ~(n & irq_wait1)):
-                break
+        (done, n) = self.wait_irq(0x04, irq_done, 2000)
 
         self.clear_bitmask(0x0D, 0x80)
 
-        if i != 0:
-            if (self.dev_read(0x06) & 0x1B) == 0x00:
-                error = False
+        if done:
+            error_reg = self.dev_read(0x06)
+            # A collision still delivers the bits before it, anticollision builds on those
+            if (error_reg & 0x13) == 0x00:
+                self.collision = bool(error_reg & 0x08)
+                error = self.collision
 
                 if n & irq & 0x01:
-                    print("E1")
+                    if not expect_timeout:
+                        print("E1")
                     error = True
 
                 if command == self.mode_transrec:
-                    n = self.dev_read(0x0A)
-                    last_bits = self.dev_read(0x0C) & 0x07
+                    if self.burst:
+                        (n, last_bits) = self.dev_read_burst((0x0A, 0x0C))
+                    else:
+                        n = self.dev_read(0x0A)
+                        last_bits = self.dev_read(0x0C)
+                    last_bits &= 0x07
                     if last_bits != 0:
                         back_length = (n - 1) * 8 + last_bits
                     else:
@@ -153,26 +337,43 @@ class RC522():
                     if n > self.length:
                         n = self.length
 
-                    for i in range(n):
-                        back_data.append(self.dev_read(0x09))
+                    back_data = self.fifo_read(n)
             else:
                 print("E2")
                 error = True
 
         return (error, back_data, back_length)
 
-    def request(self, req_mode=0x26):
+    def enable_irq(self):
+        '''
+            Lets only RxIRq drive the IRQ pin, so that a tag answering send_request() fires it
+        '''
+        self.dev_write(0x04, 0x7F)
+        self.dev_write(0x02, 0xA0)
+
+    def send_request(self, req_mode=0x26):
+        '''
+            Transmits a REQA without waiting for the answer. Call enable_irq() first, a tag in
+            the field then shows up as a falling edge on the IRQ pin.
+        '''
+        self.dev_write(0x09, req_mode)
+        self.dev_write(0x01, self.mode_transrec)
+        self.dev_write(0x0D, 0x87)
+
+    def request(self, req_mode=0x26, expect_timeout=False):
         """
         Requests for tag.
         Returns (False, None) if no tag is present, otherwise returns (True, tag type)
+        expect_timeout -- no tag answering is normal, see card_write
         """
         error = True
         back_bits = 0
 
         self.dev_write(0x0D, 0x07)
-        (error, back_data, back_bits) = self.card_write(self.mode_transrec, [req_mode, ])
+        (error, back_data, back_bits) = self.card_write(self.mode_transrec, [req_mode, ], expect_timeout)
 
-        if error or (back_bits != 0x10):
+        # Tags with different ATQAs answering together collide, there are tags all the same
+        if (error and not self.collision) or (back_bits != 0x10):
             return (True, None)
 
         return (False, back_bits)
@@ -204,24 +405,138 @@ class RC522():
 
         return (error, back_data)
 
-    def calculate_crc(self, data):
-        self.clear_bitmask(0x05, 0x04)
-        self.set_bitmask(0x0A, 0x80)
+    def anticoll_level(self, cascade, frame, known_bits):
+        """
+        One anticollision round at a cascade level (SEL 0x93/0x95/0x97).
+        frame -- the level's 5 byte frame, of which the first known_bits bits are known
+        Returns (error, frame, known_bits). known_bits is 40 once the frame is complete and
+        its BCC checks out. After a collision it ends just past the colliding bit, which is
+        set to 1: the next round follows the tags with a 1 there.
+        """
+        whole = known_bits // 8
+        extra = known_bits % 8
+        # Zero the bits after a collision instead of passing on garbage
+        self.clear_bitmask(0x0E, 0x80)
+        # The last known byte goes out partly, the answer continues it from the same bit
+        self.dev_write(0x0D, (extra << 4) | extra)
+        buf = [cascade, ((2 + whole) << 4) | extra] + frame[:whole + (1 if extra else 0)]
+        (error, back_data, back_bits) = self.card_write(self.mode_transrec, buf)
+        self.dev_write(0x0D, 0x00)
+        if error and not self.collision:
+            return (True, frame, known_bits)
+
+        frame = list(frame)
+        for i, value in enumerate(back_data[:5 - whole]):
+            if i == 0 and extra:
+                mask = (1 << extra) - 1
+                frame[whole] = (frame[whole] & mask) | (value & ~mask & 0xFF)
+            else:
+                frame[whole + i] = value
+
+        if self.collision:
+            coll = self.dev_read(0x0E)
+            if coll & 0x20:
+                return (True, frame, known_bits)
+            # CollPos counts from the first bit of the first byte received, 0 means 32
+            bit = whole * 8 + (coll & 0x1F or 32) - 1
+            if bit < known_bits or bit >= 40:
+                return (True, frame, known_bits)
+            frame[bit // 8] |= 1 << (bit % 8)
+            return (False, frame, bit + 1)
+
+        if frame[0] ^ frame[1] ^ frame[2] ^ frame[3] != frame[4]:
+            return (True, frame, known_bits)
+        return (False, frame, 40)
+
+    def select_level(self, cascade, frame):
+        """
+        Selects the tag answering to a complete frame at a cascade level.
+        Returns (error, SAK), SAK bit 0x04 means the UID continues on the next level.
+        """
+        buf = [cascade, 0x70] + list(frame)
+        crc = self.calculate_crc(buf)
+        buf.append(crc[0])
+        buf.append(crc[1])
+        (error, back_data, back_length) = self.card_write(self.mode_transrec, buf)
+        if error or back_length != 0x18:
+            return (True, 0)
+        return (False, back_data[0])
+
+    def select_card(self):
+        """
+        Resolves and selects one of the tags in the READY state, cascade level by level,
+        following the 1 branch at every collision.
+        Returns (error, uid, SAK) with a 4, 7 or 10 byte uid, the tag is left ACTIVE.
+        """
+        uid = []
+        for cascade in self.cascade_levels:
+            frame = [0, 0, 0, 0, 0]
+            known_bits = 0
+            # Every round fixes at least one more bit, so this ends within 40 rounds
+            while known_bits < 40:
+                (error, frame, known_bits) = self.anticoll_level(cascade, frame, known_bits)
+                if error:
+                    return (True, uid, 0)
+            (error, sak) = self.select_level(cascade, frame)
+            if error:
+                return (True, uid, 0)
+            if not sak & 0x04:
+                return (False, uid + frame[:4], sak)
+            # frame[0] is the cascade tag
+            uid += frame[1:4]
+        return (True, uid, 0)
+
+    def inventory(self, ready=False):
+        """
+        Identifies every tag in the field: resolve one, HALT it so it drops out, REQA the
+        rest, until nobody answers. ready -- the tags already answered a REQA (e.g. the one
+        that fired the IRQ), skip the first one.
+        Returns [(uid, SAK), ...], the tags are left HALTed.
+        """
+        cards = []
+        # Only anticollision, SELECT, HLTA and REQA here, the last REQA is never answered
+        self.set_timer(self.quick_reload)
+        try:
+            while len(cards) < self.inventory_limit:
+                if not ready:
+                    (error, tag_type) = self.request(expect_timeout=True)
+                    if error:
+                        break
+                ready = False
+                (error, uid, sak) = self.select_card()
+                if error:
+                    break
+                self.halt()
+                cards.append((uid, sak))
+        finally:
+            self.set_timer(self.timer_reload)
+        return cards
 
-        for i in range(len(data)):
-            self.dev_write(0x09, data[i])
+    def calculate_crc(self, data):
+        if self.use_irq:
+            # CRCIRq is the only source allowed on the IRQ line while the coprocessor runs
+            self.dev_write(0x02, 0x80)
+            self.dev_write(0x03, 0x04)
+        # DivIrq clears the bits written, 0x04 clears CRCIRq
+        self.dev_write(0x05, 0x04)
+        self.dev_write(0x0A, 0x80)
+
+        self.fifo_write(data)
+        self.irq.clear()
         self.dev_write(0x01, self.mode_crc)
 
-        i = 255
-        while True:
-            n = self.dev_read(0x05)
-            i -= 1
-            if not ((i != 0) and not (n & 0x04)):
-                break
+        self.wait_irq(0x05, 0x04, 255)
 
-        ret_data = []
-        ret_data.append(self.dev_read(0x22))
-        ret_data.append(self.dev_read(0x21))
+        if self.burst:
+            ret_data = self.dev_read_burst((0x22, 0x21))
+        else:
+            ret_data = []
+            ret_data.append(self.dev_read(0x22))
+            ret_data.append(self.dev_read(0x21))
+
+        if self.use_irq:
+            # Release the IRQ line so the next command gets its falling edge
+            self.dev_write(0x05, 0x04)
 
         return ret_data
 
@@ -291,8 +606,11 @@ class RC522():
         buf.append(0)
 
         crc = self.calculate_crc(buf)
+        buf.append(crc[0])
+        buf.append(crc[1])
         self.clear_bitmask(0x08, 0x80)
-        self.card_write(self.mode_transrec, buf)
+        # A halted tag doesn't answer, the write ends in a timeout by design
+        self.card_write(self.mode_transrec, buf, expect_timeout=True)
         self.clear_bitmask(0x08, 0x08)
         self.authed = False
 
@@ -346,3 +664,6 @@ class RC522():
     def reset(self):
         authed = False
         self.dev_write(0x01, self.mode_reset)
+        # SoftReset puts every register back to its default, drop what we knew
+        if self.shadow is not None:
+            self.shadow.clear()
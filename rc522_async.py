@@ -0,0 +1,111 @@
+import time
+import asyncio
+
+from rc522 import RC522
+from spi_bus import spi_bus
+
+
+class AsyncRC522():
+    '''
+        asyncio front end for RC522. IRQ edges from the GPIO thread are handed to the event
+        loop with call_soon_threadsafe and the SPI work runs on an executor, so nothing here
+        blocks the loop. Each call is one job on the SPI bus arbiter, by default as a device
+        of its own on spi_bus (see spi_bus.py), so it runs uninterrupted by other readers.
+
+        reader = AsyncRC522(8, 24, 25, 0)
+        await reader.wait_for_card()
+        (error, tag_type) = await reader.request()
+        (error, uid) = await reader.anticoll()
+    '''
+    # A tag entering the field only answers a REQA sent while it is there
+    poll_interval = 0.1
+
+    def __init__(self, pin_sda=8, pin_irq=24, pin_rst=25, device=0, bus=0, transport=None, executor=None, shadow=True):
+        self.executor = executor or spi_bus.device('sda' + str(pin_sda))
+        self.loop = None
+        self.waiter = None
+        self.irq_time = 0
+        # init() puts the antenna through a reset, which wakes HALTed tags, so only once
+        self.armed = False
+        self.reader = RC522(self.irq_callback, pin_sda, pin_irq, pin_rst, device, bus, transport=transport, shadow=shadow)
+
+    def irq_callback(self, pin):
+        # GPIO thread, never touch the future from here
+        self.irq_time = time.monotonic()
+        loop = self.loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self.wake)
+
+    def wake(self):
+        # The waiter may be shared by several readers (see ReaderPool), tell it who fired
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(self)
+
+    async def run(self, func, *args):
+        self.loop = asyncio.get_running_loop()
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    async def wait_for_card(self, timeout=None):
+        '''
+            Waits for a tag to answer a REQA, repeating the REQA every poll_interval.
+            Returns True when a tag is there, False if timeout (seconds) passed first.
+        '''
+        if not self.armed:
+            await self.init()
+        await self.run(self.reader.enable_irq)
+        # Created after the reset so edges from before it are already drained
+        self.waiter = self.loop.create_future()
+        deadline = None if timeout is None else self.loop.time() + timeout
+        try:
+            while True:
+                wait = self.poll_interval
+                if deadline is not None:
+                    wait = min(wait, deadline - self.loop.time())
+                    if wait <= 0:
+                        return False
+                await self.run(self.reader.send_request)
+                try:
+                    await asyncio.wait_for(asyncio.shield(self.waiter), wait)
+                    return True
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.waiter = None
+
+    async def init(self):
+        await self.run(self.reader.init)
+        self.armed = True
+
+    async def request(self, req_mode=0x26):
+        return await self.run(self.reader.request, req_mode)
+
+    async def anticoll(self):
+        return await self.run(self.reader.anticoll)
+
+    async def select_card(self):
+        return await self.run(self.reader.select_card)
+
+    async def inventory(self, ready=False):
+        return await self.run(self.reader.inventory, ready)
+
+    async def select_tag(self, uid):
+        return await self.run(self.reader.select_tag, uid)
+
+    async def card_auth(self, auth_mode, block_address, key, uid):
+        return await self.run(self.reader.card_auth, auth_mode, block_address, key, uid)
+
+    async def read(self, block_address):
+        return await self.run(self.reader.read, block_address)
+
+    async def write(self, block_address, data):
+        return await self.run(self.reader.write, block_address, data)
+
+    async def halt(self):
+        return await self.run(self.reader.halt)
+
+    async def stop_crypto(self):
+        return await self.run(self.reader.stop_crypto)
+
+    @property
+    def authed(self):
+        return self.reader.authed
@@ -0,0 +1,501 @@
+'''
+    Register level software model of the MFRC522 so rc522.RC522 can be run, profiled and
+    regression tested without a Pi or real boards attached.
+
+    sim = MFRC522Sim()
+    sim.place(VirtualCard([4, 23, 91, 192]))
+    reader = RC522(callback, transport=sim)
+    sim.track(reader)
+    reader.request()
+    print(sim.stats['request'])  # {'transactions': .., 'bytes': ..}
+
+    By default the model is instantaneous: a command completes inside the SPI frame that
+    starts it and the IRQ callback fires before xfer2 returns. With latency set, commands
+    complete that many seconds later from a timer thread, like a card taking time to answer.
+'''
+import threading
+
+
+# Registers
+CommandReg = 0x01
+ComIEnReg = 0x02
+DivIEnReg = 0x03
+ComIrqReg = 0x04
+DivIrqReg = 0x05
+ErrorReg = 0x06
+Status1Reg = 0x07
+Status2Reg = 0x08
+FIFODataReg = 0x09
+FIFOLevelReg = 0x0A
+ControlReg = 0x0C
+BitFramingReg = 0x0D
+CollReg = 0x0E
+ModeReg = 0x11
+TxControlReg = 0x14
+TxASKReg = 0x15
+CRCResultRegH = 0x21
+CRCResultRegL = 0x22
+TModeReg = 0x2A
+VersionReg = 0x37
+
+# Commands
+Idle = 0x00
+CalcCRC = 0x03
+Transceive = 0x0C
+MFAuthent = 0x0E
+SoftReset = 0x0F
+
+# ComIrqReg bits
+TxIRq = 0x40
+RxIRq = 0x20
+IdleIRq = 0x10
+TimerIRq = 0x01
+# DivIrqReg bits
+CRCIRq = 0x04
+# ErrorReg bits
+BufferOvfl = 0x10
+CollErr = 0x08
+
+FIFO_SIZE = 64
+
+RESET_VALUES = {
+    CommandReg: 0x20,
+    ComIEnReg: 0x80,
+    ModeReg: 0x3F,
+    TxControlReg: 0x80,
+    CollReg: 0x80,
+    CRCResultRegH: 0xFF,
+    CRCResultRegL: 0xFF,
+    VersionReg: 0x92,
+}
+
+SEL_CL1 = 0x93
+SEL_CL2 = 0x95
+SEL_CL3 = 0x97
+CASCADE_TAG = 0x88
+
+
+def crc_a(data):
+    '''ISO 14443-3 CRC_A, returned LSB first as it is sent on air'''
+    crc = 0x6363
+    for b in data:
+        b = (b ^ crc) & 0xFF
+        b = (b ^ (b << 4)) & 0xFF
+        crc = ((crc >> 8) ^ (b << 8) ^ (b << 3) ^ (b >> 4)) & 0xFFFF
+    return [crc & 0xFF, crc >> 8]
+
+
+def to_bits(data, last_bits=0):
+    '''bytes to a list of bits, LSB first. last_bits limits the final byte (0 = whole byte)'''
+    bits = []
+    for i, b in enumerate(data):
+        count = last_bits if (i == len(data) - 1 and last_bits) else 8
+        for j in range(count):
+            bits.append((b >> j) & 1)
+    return bits
+
+
+def to_bytes(bits):
+    data = []
+    for i in range(0, len(bits), 8):
+        b = 0
+        for j, bit in enumerate(bits[i:i + 8]):
+            b |= bit << j
+        data.append(b)
+    return data
+
+
+class VirtualCard():
+    '''
+        A MIFARE Classic style PICC. uid can be 4, 7 or 10 bytes, the cascade frames, ATQA and
+        SAK are derived from it. blocks holds 16 byte data blocks, keys is the key A/B used for
+        every sector.
+    '''
+    state_idle = 'IDLE'
+    state_ready = 'READY'
+    state_active = 'ACTIVE'
+    state_halt = 'HALT'
+
+    def __init__(self, uid, sak=0x08, key=None, blocks=64):
+        if len(uid) not in (4, 7, 10):
+            raise ValueError('uid must be 4, 7 or 10 bytes')
+        if uid[0] == 0x88:
+            # Reserved for the cascade tag, a reader would take it for a longer UID
+            raise ValueError('uid can not start with the cascade tag 0x88')
+        self.uid = list(uid)
+        self.sak = sak
+        self.key = list(key) if key else [0xFF] * 6
+        self.blocks = [[0] * 16 for i in range(blocks)]
+        for i in range(3, blocks, 4):
+            self.blocks[i] = self.key + [0xFF, 0x07, 0x80, 0x69] + self.key
+        self.blocks[0][:4] = self.uid[:4]
+        self.power_off()
+
+    @property
+    def atqa(self):
+        size = {4: 0x00, 7: 0x40, 10: 0x80}[len(self.uid)]
+        return [0x04 | size, 0x00]
+
+    def cascade_frames(self):
+        '''The 5 byte (4 UID bytes + BCC) frame answered at each cascade level'''
+        if len(self.uid) == 4:
+            parts = [self.uid]
+        elif len(self.uid) == 7:
+            parts = [[CASCADE_TAG] + self.uid[:3], self.uid[3:]]
+        else:
+            parts = [[CASCADE_TAG] + self.uid[:3], [CASCADE_TAG] + self.uid[3:6], self.uid[6:]]
+        frames = []
+        for part in parts:
+            bcc = 0
+            for b in part:
+                bcc ^= b
+            frames.append(part + [bcc])
+        return frames
+
+    def auth_uid(self):
+        return self.uid[-4:]
+
+    def power_off(self):
+        self.state = self.state_idle
+        self.level = 0
+        self.pending_write = None
+        self.authed = False
+
+    def respond(self, bits):
+        '''Returns the bits the card answers with, or None when it stays silent'''
+        if len(bits) == 7:
+            cmd = to_bytes(bits)[0]
+            if cmd == 0x26 and self.state == self.state_idle or \
+                    cmd == 0x52 and self.state in (self.state_idle, self.state_halt):
+                self.state = self.state_ready
+                self.level = 0
+                return to_bits(self.atqa)
+            if self.state in (self.state_ready, self.state_active):
+                # ISO 14443-3: anything but the next step of the protocol sends it back to IDLE
+                self.state = self.state_idle
+            return None
+        if self.state == self.state_ready:
+            return self.respond_ready(bits)
+        if self.state == self.state_active:
+            return self.respond_active(bits)
+        return None
+
+    def respond_ready(self, bits):
+        if len(bits) < 16:
+            return None
+        sel, nvb = to_bytes(bits[:16])
+        frames = self.cascade_frames()
+        if sel not in (SEL_CL1, SEL_CL2, SEL_CL3):
+            # e.g. the HLTA meant for the tag selected next to this one
+            self.state = self.state_idle
+            return None
+        if sel != (SEL_CL1, SEL_CL2, SEL_CL3)[self.level]:
+            return None
+        frame_bits = to_bits(frames[self.level])
+        if nvb == 0x70:
+            data = to_bytes(bits)
+            if len(bits) != 72 or crc_a(data[:7]) != data[7:] or data[2:7] != frames[self.level]:
+                return None
+            if self.level == len(frames) - 1:
+                sak = self.sak
+                self.state = self.state_active
+            else:
+                sak = 0x04
+                self.level += 1
+            return to_bits([sak] + crc_a([sak]))
+        known = ((nvb >> 4) - 2) * 8 + (nvb & 0x07)
+        if known < 0 or known > 40 or len(bits) != 16 + known:
+            return None
+        if bits[16:] != frame_bits[:known]:
+            return None
+        return frame_bits[known:]
+
+    def respond_active(self, bits):
+        data = to_bytes(bits)
+        if len(bits) % 8 or len(data) < 3 or crc_a(data[:-2]) != data[-2:]:
+            self.power_off()
+            return None
+        data = data[:-2]
+        if self.pending_write is not None:
+            block = self.pending_write
+            self.pending_write = None
+            if len(data) != 16:
+                return to_bits([0x04], 4)
+            self.blocks[block] = list(data)
+            return to_bits([0x0A], 4)
+        if data[0] == 0x50 and len(data) == 2:
+            self.state = self.state_halt
+            self.authed = False
+            return None
+        if data[0] in (0x30, 0xA0) and len(data) == 2:
+            if not self.authed or data[1] >= len(self.blocks):
+                return to_bits([0x04], 4)
+            if data[0] == 0x30:
+                return to_bits(self.blocks[data[1]] + crc_a(self.blocks[data[1]]))
+            self.pending_write = data[1]
+            return to_bits([0x0A], 4)
+        return None
+
+
+class MFRC522Sim():
+    '''
+        Software MFRC522 usable as an RC522 transport. Emulates the register file, the FIFO,
+        the IRQ registers and line, the CRC coprocessor and the Transceive/MFAuthent commands
+        against the VirtualCards placed in its field.
+
+        Every xfer2 call is one SPI transaction. Counts are kept in total and per operation,
+        the operation being the outermost tracked RC522 method running (see track()).
+    '''
+    tracked = ('request', 'anticoll', 'select_tag', 'select_card', 'inventory', 'read', 'write')
+
+    def __init__(self, pin_irq=24, latency=0):
+        self.pin_irq = pin_irq
+        self.latency = latency
+        self.irq_callback = None
+        self.irq_line = False
+        self.field = []
+        self.lock = threading.RLock()
+        self.operation = None
+        self.generation = 0
+        self.reset_stats()
+        self.soft_reset()
+
+    # field
+    def place(self, card):
+        self.field.append(card)
+        return card
+
+    def remove(self, card):
+        self.field.remove(card)
+        card.power_off()
+
+    # transport interface
+    def set_irq_callback(self, callback):
+        self.irq_callback = callback
+
+    def xfer2(self, data):
+        with self.lock:
+            self.count(len(data))
+            if data[0] & 0x80:
+                result = [0]
+                for address in data[:-1]:
+                    result.append(self.read_reg((address >> 1) & 0x3F))
+            else:
+                address = (data[0] >> 1) & 0x3F
+                for value in data[1:]:
+                    self.write_reg(address, value)
+                result = [0] * len(data)
+            fire = self.update_irq()
+        if fire and self.irq_callback:
+            self.irq_callback(self.pin_irq)
+        return result
+
+    def close(self):
+        pass
+
+    # statistics
+    def reset_stats(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.stats = {}
+
+    def count(self, length):
+        self.transactions += 1
+        self.bytes += length
+        if self.operation:
+            op = self.stats.setdefault(self.operation, {'transactions': 0, 'bytes': 0})
+            op['transactions'] += 1
+            op['bytes'] += length
+
+    def track(self, reader, operations=None):
+        '''Wraps the reader methods so their bus traffic is accounted under their own name'''
+        for name in operations or self.tracked:
+            setattr(reader, name, self.tracking(name, getattr(reader, name)))
+        return reader
+
+    def tracking(self, name, method):
+        def wrapper(*args, **kwargs):
+            outer = self.operation
+            if outer is None:
+                self.operation = name
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.operation = outer
+        return wrapper
+
+    # register file
+    def soft_reset(self):
+        self.regs = [0] * 64
+        for address, value in RESET_VALUES.items():
+            self.regs[address] = value
+        self.fifo = []
+        self.antenna(False)
+
+    def read_reg(self, address):
+        if address == FIFODataReg:
+            return self.fifo.pop(0) if self.fifo else 0
+        if address == FIFOLevelReg:
+            return len(self.fifo)
+        if address in (ComIrqReg, DivIrqReg):
+            return self.regs[address] & 0x7F
+        return self.regs[address]
+
+    def write_reg(self, address, value):
+        value &= 0xFF
+        if address == FIFODataReg:
+            if len(self.fifo) < FIFO_SIZE:
+                self.fifo.append(value)
+            else:
+                self.regs[ErrorReg] |= BufferOvfl
+        elif address == FIFOLevelReg:
+            if value & 0x80:
+                self.fifo = []
+                self.regs[ErrorReg] &= ~BufferOvfl
+        elif address in (ComIrqReg, DivIrqReg):
+            # bit 7 selects whether the marked bits are set or cleared
+            if value & 0x80:
+                self.regs[address] |= value & 0x7F
+            else:
+                self.regs[address] &= ~value & 0x7F
+        elif address == CommandReg:
+            self.regs[CommandReg] = (self.regs[CommandReg] & 0xF0) | (value & 0x0F)
+            self.command(value & 0x0F)
+        elif address == BitFramingReg:
+            self.regs[BitFramingReg] = value & 0x7F
+            if value & 0x80 and self.regs[CommandReg] & 0x0F == Transceive:
+                self.transceive()
+        elif address == TxControlReg:
+            self.regs[TxControlReg] = value
+            self.antenna(value & 0x03 != 0)
+        elif address == VersionReg:
+            pass
+        else:
+            self.regs[address] = value
+
+    def antenna(self, on):
+        if not on:
+            for card in self.field:
+                card.power_off()
+
+    def antenna_on(self):
+        return self.regs[TxControlReg] & 0x03 != 0
+
+    def update_irq(self):
+        '''Recomputes the IRQ line, True on the edge that should fire the GPIO callback'''
+        level = bool(self.regs[ComIEnReg] & self.regs[ComIrqReg] & 0x7F) or \
+            bool(self.regs[DivIEnReg] & self.regs[DivIrqReg] & 0x14)
+        fire = level and not self.irq_line
+        self.irq_line = level
+        return fire
+
+    # commands
+    def complete(self, finish):
+        '''Applies the outcome of the running command now, or after latency'''
+        if not self.latency:
+            finish()
+            return
+        generation = self.generation
+
+        def deferred():
+            with self.lock:
+                # a newer command or reset overrides this one
+                if generation != self.generation:
+                    return
+                finish()
+                fire = self.update_irq()
+            if fire and self.irq_callback:
+                self.irq_callback(self.pin_irq)
+        timer = threading.Timer(self.latency, deferred)
+        timer.daemon = True
+        timer.start()
+
+    def command(self, cmd):
+        self.generation += 1
+        if cmd == SoftReset:
+            self.soft_reset()
+        elif cmd == CalcCRC:
+            crc = crc_a(self.fifo)
+            self.fifo = []
+
+            def finish():
+                self.regs[CRCResultRegL] = crc[0]
+                self.regs[CRCResultRegH] = crc[1]
+                self.regs[DivIrqReg] |= CRCIRq
+            self.complete(finish)
+        elif cmd == MFAuthent:
+            self.authenticate()
+
+    def authenticate(self):
+        data = self.fifo
+        self.fifo = []
+        self.regs[ErrorReg] = 0
+        for card in self.field:
+            if self.antenna_on() and card.state == card.state_active and len(data) >= 12 \
+                    and data[8:12] == card.auth_uid() and data[2:8] == card.key:
+                card.authed = True
+
+                def finish():
+                    self.regs[Status2Reg] |= 0x08
+                    self.regs[ComIrqReg] |= IdleIRq
+                    self.regs[CommandReg] &= 0xF0
+                self.complete(finish)
+                return
+
+        def timeout():
+            self.regs[ComIrqReg] |= TimerIRq
+        self.complete(timeout)
+
+    def transceive(self):
+        tx_last_bits = self.regs[BitFramingReg] & 0x07
+        rx_align = (self.regs[BitFramingReg] >> 4) & 0x07
+        bits = to_bits(self.fifo, tx_last_bits)
+        self.fifo = []
+        self.regs[ErrorReg] = 0
+        self.regs[ComIrqReg] |= TxIRq
+
+        answers = []
+        if self.antenna_on():
+            for card in self.field:
+                answer = card.respond(bits)
+                if answer is not None:
+                    answers.append(answer)
+        if not answers:
+            def timeout():
+                if self.regs[TModeReg] & 0x80:
+                    self.regs[ComIrqReg] |= TimerIRq
+            self.complete(timeout)
+            return
+
+        def finish():
+            received, collision = self.merge(answers)
+            if collision is not None:
+                self.regs[ErrorReg] |= CollErr
+                position = rx_align + collision + 1
+                self.regs[CollReg] = (self.regs[CollReg] & 0x80) | (position & 0x1F if position < 32 else 0)
+                if not self.regs[CollReg] & 0x80:
+                    received = received[:collision + 1] + [0] * (len(received) - collision - 1)
+            else:
+                self.regs[CollReg] = (self.regs[CollReg] & 0x80) | 0x20
+            aligned = [0] * rx_align + received
+            self.fifo = to_bytes(aligned)[:FIFO_SIZE]
+            self.regs[ControlReg] = (self.regs[ControlReg] & 0xF8) | (len(aligned) % 8)
+            self.regs[ComIrqReg] |= RxIRq
+        self.complete(finish)
+
+    def merge(self, answers):
+        '''Overlays simultaneous answers, returning the bits and the first collision index'''
+        length = max(len(a) for a in answers)
+        received = []
+        collision = None
+        for i in range(length):
+            values = set(a[i] for a in answers if i < len(a))
+            if len(values) > 1:
+                if collision is None:
+                    collision = i
+                received.append(1)
+            else:
+                received.append(values.pop())
+        if collision is None and len(set(len(a) for a in answers)) > 1:
+            collision = min(len(a) for a in answers)
+        return received, collision
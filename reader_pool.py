@@ -0,0 +1,106 @@
+import time
+import asyncio
+
+from rc522_async import AsyncRC522
+from spi_bus import spi_bus
+from metrics import metrics
+
+
+class ReaderPool():
+    '''
+        Any number of RC522 readers waited on together. Every reader is re-armed in one
+        executor pass and a single future is shared by all of them, so the first IRQ to fire
+        wakes the pool no matter how many readers there are.
+
+        By default every reader is a device of its own on spi_bus and the pool's passes over
+        all of them run as the 'pool' device. An executor passed in is used for all of them.
+
+        pool = ReaderPool([
+            {'pin_sda': 8, 'pin_irq': 24, 'pin_rst': 25, 'device': 0},
+            {'pin_sda': 7, 'pin_irq': 1, 'pin_rst': 0, 'device': 1},
+        ])
+        (index, reader) = await pool.wait_for_any()
+    '''
+    poll_interval = AsyncRC522.poll_interval
+
+    def __init__(self, pin_maps, executor=None):
+        self.executor = executor or spi_bus.device('pool')
+        self.readers = [AsyncRC522(executor=executor, **pins) for pins in pin_maps]
+        # Per reader detection latency: IRQ edge in the GPIO thread -> pool resumed
+        self.latency = [{'count': 0, 'last': 0, 'max': 0, 'total': 0} for reader in self.readers]
+        self.wakeups = [metrics.histogram('rfid_gate_irq_wakeup_seconds', 'IRQ edge in the GPIO thread to the waiting task resumed', reader=str(i)) for i in range(len(self.readers))]
+
+    def __len__(self):
+        return len(self.readers)
+
+    def __iter__(self):
+        return iter(self.readers)
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def arm(self):
+        for reader in self.readers:
+            if not reader.armed:
+                reader.reader.init()
+                reader.armed = True
+            reader.reader.enable_irq()
+
+    def send_requests(self):
+        for reader in self.readers:
+            reader.reader.send_request()
+
+    async def wait_for_any(self, timeout=None):
+        '''
+            Waits until a tag answers on any reader.
+            Returns (index, AsyncRC522) of the first one, or (None, None) on timeout.
+        '''
+        loop = asyncio.get_running_loop()
+        for reader in self.readers:
+            reader.loop = loop
+        await self.run(self.arm)
+        # Shared by every reader, created after the reset so older edges are drained
+        waiter = loop.create_future()
+        for reader in self.readers:
+            reader.waiter = waiter
+        deadline = None if timeout is None else loop.time() + timeout
+        try:
+            while True:
+                wait = self.poll_interval
+                if deadline is not None:
+                    wait = min(wait, deadline - loop.time())
+                    if wait <= 0:
+                        return (None, None)
+                await self.run(self.send_requests)
+                try:
+                    reader = await asyncio.wait_for(asyncio.shield(waiter), wait)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for other in self.readers:
+                other.waiter = None
+
+        index = self.readers.index(reader)
+        self.record(index, time.monotonic() - reader.irq_time)
+        return (index, reader)
+
+    async def wait_for(self, index, timeout=None):
+        '''
+            Waits for a tag on one reader only, for callers running a loop per reader.
+            Returns the AsyncRC522, or None on timeout.
+        '''
+        reader = self.readers[index]
+        if not await reader.wait_for_card(timeout):
+            return None
+        self.record(index, time.monotonic() - reader.irq_time)
+        return reader
+
+    def record(self, index, latency):
+        stats = self.latency[index]
+        stats['count'] += 1
+        stats['last'] = latency
+        stats['total'] += latency
+        if latency > stats['max']:
+            stats['max'] = latency
+        self.wakeups[index].observe(latency)
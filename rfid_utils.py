@@ -1,186 +1,123 @@
 # https://github.com/ondryaso/pi-rc522
 
-import threading
 import RPi.GPIO as GPIO
 import asyncio
-import datetime
 
-from rc522 import RC522
+from reader_pool import ReaderPool
+from lane import Lane
+from supervisor import Supervisor
 from db_utils import DB
-from models import Employee
+from access_rules import rules
 
 
 class RFID_UTIL():
-    irq1 = threading.Event()
-    irq2 = threading.Event()
+    # One entry per gate: its rc522 reader (see rc522.py to know which params to pass),
+    # the relay that opens it, the EOT pin that reports the gate turned and the direction
+    # a pass through it is clocked as (1 = in, 2 = out)
+    lanes = [
+        {'reader': {'pin_sda': 8, 'pin_irq': 24, 'pin_rst': 25, 'device': 0}, 'pin_relay': 2, 'pin_eot': 17, 'direction': 1},
+        {'reader': {'pin_sda': 7, 'pin_irq': 1, 'pin_rst': 0, 'device': 1}, 'pin_relay': 3, 'pin_eot': 27, 'direction': 2},
+    ]
 
     def __init__(self, parent):
-        self.parent = parent  # Allows us to restart the rfid loop and do other stuff above
+        self.parent = parent  # Allows us to do other stuff above
+
+        # Initialize multiple rc522 readers, each waits on its own IRQ pin to lower cpu usage
+        for lane in self.lanes:
+            rules.check_direction(lane['direction'])
+        self.pool = ReaderPool([lane['reader'] for lane in self.lanes])
+        self.pipelines = [Lane(self, self.pool, i, lane['direction']) for i, lane in enumerate(self.lanes)]
+        for lane in self.pipelines:
+            # A clock or sync update of the tag's holder makes the lane decide again
+            DB.index.subscribe(lane.recent.discard)
+        self.supervisors = [Supervisor('lane ' + str(lane.index), lane.step, lane.restart) for lane in self.pipelines]
 
-        # Initialize multiple rc522 readers that use a unique IRQ Callback function to lower cpu usage
-        # See rc522.py to know which params to pass
-        self.reader1 = RC522(self.irq_callback1, 8, 24, 25, 0)
-        self.reader2 = RC522(self.irq_callback2, 7, 1, 0, 1)
-        
         # Relay GPIO pins to open/close/turn gates
-        self.pin_relay1 = 2
-        self.pin_relay2 = 3
         self.pin_buzzer = 21
-        GPIO.setup(self.pin_relay1, GPIO.OUT)
-        GPIO.setup(self.pin_relay2, GPIO.OUT)
+        for lane in self.lanes:
+            GPIO.setup(lane['pin_relay'], GPIO.OUT)
+            GPIO.output(lane['pin_relay'], 1)
         GPIO.setup(self.pin_buzzer, GPIO.OUT)
-        GPIO.output(self.pin_relay1, 1)
-        GPIO.output(self.pin_relay2, 1)
         GPIO.output(self.pin_buzzer, 0)
-
+        # Every lane beeps on the one buzzer, a pattern plays whole before the next starts
+        self.buzzer = asyncio.Lock()
 
         # EOT GPIO pins to notify end of transactions
-        self.pin_eot1 = 17
-        self.pin_eot2 = 27
-        GPIO.setup(self.pin_eot1, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-        GPIO.setup(self.pin_eot2, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-
-    def irq_callback1(self, pin):
-        '''
-            If a tag gets detected, it will trigger here first and then break the
-            while loop "not self.irq1.wait(0.1)" inside "waiting_for_tag"
-        '''
-        self.irq1.set()
-
-    def irq_callback2(self, pin):
-        self.irq2.set()
+        for lane in self.lanes:
+            GPIO.setup(lane['pin_eot'], GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
 
     async def wait_for_tag(self):
         '''
-            enable IRQ on detect
+            Runs every lane as its own pipeline, a tap on one gate never waits for another
+            gate's turnstile. The lanes share the SPI bus through the spi_bus arbiter and the
+            DB through the event loop thread.
         '''
-        self.reader1.init()
-        self.irq1.clear()
-        self.reader1.dev_write(0x04, 0x00)
-        self.reader1.dev_write(0x02, 0xA0)
-
-        self.reader2.init()
-        self.irq2.clear()
-        self.reader2.dev_write(0x04, 0x00)
-        self.reader2.dev_write(0x02, 0xA0)
-
-        # wait for it
-        waiting1 = True
-        waiting2 = True
-        while waiting1 and waiting2:
-            # asyncio.sleep helps with responsiveness if you have a UI loop running or other modules
-            await asyncio.sleep(0.01)
-            self.reader1.dev_write(0x09, 0x26)
-            self.reader1.dev_write(0x01, 0x0C)
-            self.reader1.dev_write(0x0D, 0x87)
-
-            self.reader2.dev_write(0x09, 0x26)
-            self.reader2.dev_write(0x01, 0x0C)
-            self.reader2.dev_write(0x0D, 0x87)
-            waiting1 = not self.irq1.wait(0.1)
-            waiting2 = not self.irq2.wait(0.1)
-        
-        if not waiting1:
-            # rfid 1 detected a tag
-            self.irq1.clear()
-            self.reader1.init()
-            (error, tag_type) = self.reader1.request()
-            if not error:
-                (error, uid) = self.reader1.anticoll()
-                if not error:
-                    print('UID = ' + str(uid))
-                    # do authentication
-                    await self.checkTag(str(uid), 1)
-                else:
-                    print('anticoll error')
-                    await self.parent.restartRfidLoop()
-            else:
-                print('request error')
-                await self.parent.restartRfidLoop()
-        
-        if not waiting2:
-            # rfid 2 detected a tag
-            self.irq2.clear()
-            self.reader2.init()
-            (error, tag_type) = self.reader2.request()
-            if not error:
-                (error, uid) = self.reader2.anticoll()
-                if not error:
-                    print('UID = ' + str(uid))
-                    await self.checkTag(str(uid), 2)
-                else:
-                    print('anticoll error')
-                    await self.parent.restartRfidLoop()
-            else:
-                print('request error')
-                await self.parent.restartRfidLoop()
+        await asyncio.gather(*[supervisor.run() for supervisor in self.supervisors])
 
     def cleanup(self):
         """
         Calls stop_crypto() if needed and cleanups GPIO.
         """
-        self.irq1.clear()
-        self.irq2.clear()
-        if self.reader1.authed:
-            self.reader1.stop_crypto()
-        if self.reader2.authed:
-            self.reader2.stop_crypto()
-        GPIO.cleanup()
+        try:
+            for reader in self.pool:
+                if not reader.authed:
+                    continue
+                try:
+                    # On the bus, a lane may be in the middle of a command
+                    reader.executor.submit(reader.reader.stop_crypto).result(1)
+                except Exception as e:
+                    print('stop_crypto failed: ' + repr(e))
+        finally:
+            GPIO.cleanup()
 
     async def checkTag(self, uid, direction):
+        '''
+            Returns True if the tag (a uid.UID) may pass through the gate of this direction
+        '''
         print('checkTag')
-        res = DB.getFilterObjects(Employee, f"RfidCode == '{uid}' AND Termdate is NULL")
-        if len(res) == 1:
-            date = int(datetime.datetime.now().timestamp() * 1000)
-            if direction == 1 and res[0]['LogType'] == 4:
-                await self.openRelay(direction)
-                await self.waitEOT(uid, direction)
-            elif direction == 2 and res[0]['LogType'] == 3:
-                await self.openRelay(direction)
-                await self.waitEOT(uid, direction)
-            elif direction == 1 and res[0]['LogType'] == 3:
-                print('unauthorized 1')
-                await self.failBeep()
-                await asyncio.sleep(0.5)
-            elif direction == 2 and res[0]['LogType'] == 4:
-                print('unauthorized 2')
-                await self.failBeep()
-                await asyncio.sleep(0.5)
-            elif res[0]['LogDateUTC'] + 30000 > date:
-                print('unauthorized 3')
-                await self.failBeep()
-                await asyncio.sleep(0.5)
-            else:
-                await self.openRelay(direction)
-                await self.waitEOT(uid, direction)
-        elif len(res) == 0:
+        res = DB.getTag(uid)
+        if len(res) != 1:
             print('unauthorized')
-            await self.failBeep()
-        await self.parent.restartRfidLoop()
+            return False
+        (allowed, reason) = rules.decide(res[0], direction)
+        if not allowed:
+            print('unauthorized: ' + reason)
+        return allowed
 
-    async def openRelay(self, direction):
-        GPIO.output(self.pin_buzzer, 1)
-        if direction == 1:
-            GPIO.output(self.pin_relay1, 0)
-            print('In relay triggered')
-            await asyncio.sleep(0.5)
-            GPIO.output(self.pin_relay1, 1)
-        else:
-            GPIO.output(self.pin_relay2, 0)
-            print('Out relay triggered')
+    async def beep(self, *pattern):
+        '''
+            Sounds the buzzer for pattern[0] seconds, silent for pattern[1], on for
+            pattern[2], ... and leaves it off. Waits for another lane's pattern to finish.
+        '''
+        async with self.buzzer:
+            try:
+                for i, duration in enumerate(pattern):
+                    GPIO.output(self.pin_buzzer, 1 if i % 2 == 0 else 0)
+                    await asyncio.sleep(duration)
+            finally:
+                GPIO.output(self.pin_buzzer, 0)
+
+    async def openRelay(self, lane):
+        pin_relay = self.lanes[lane.index]['pin_relay']
+        GPIO.output(pin_relay, 0)
+        print(('In' if lane.direction == 1 else 'Out') + ' relay ' + str(lane.index) + ' triggered')
+        # The gate opens at once, its beep may have to wait for another lane's
+        beep = asyncio.ensure_future(self.beep(0.5))
+        try:
             await asyncio.sleep(0.5)
-            GPIO.output(self.pin_relay2, 1)
-        
-        GPIO.output(self.pin_buzzer, 0)
+        finally:
+            GPIO.output(pin_relay, 1)
+        await beep
 
-    async def waitEOT(self, uid, direction):
+    async def waitEOT(self, uid, lane):
         print('waitEOT')
+        pin_eot = self.lanes[lane.index]['pin_eot']
         waiting = True
         count = 0
         while waiting:
-            if GPIO.input(self.pin_eot1) == GPIO.HIGH or GPIO.input(self.pin_eot2) == GPIO.HIGH:
+            if GPIO.input(pin_eot) == GPIO.HIGH:
                 waiting = False
-                DB.addClock(uid, direction)
+                DB.addClock(uid, lane.direction)
                 print('Gate turned successfully')
             count += 1
             # after 10 seconds, gate will close itself and person didn't go through
@@ -190,10 +127,4 @@ class RFID_UTIL():
             await asyncio.sleep(0.1)
 
     async def failBeep(self):
-        GPIO.output(self.pin_buzzer, 1)
-        await asyncio.sleep(0.2)
-        GPIO.output(self.pin_buzzer, 0)
-        await asyncio.sleep(0.2)
-        GPIO.output(self.pin_buzzer, 1)
-        await asyncio.sleep(0.2)
-        GPIO.output(self.pin_buzzer, 0)
+        await self.beep(0.2, 0.2, 0.2)
@@ -0,0 +1,123 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future
+
+from metrics import metrics
+
+
+class SpiBus():
+    '''
+        Arbiter for the readers sharing SCK/MOSI/MISO. Every job runs on the bus's single
+        worker thread, one at a time, and a job is a whole command sequence (RC522.init,
+        card_write, inventory, ...), so no reader's frames ever land in the middle of
+        another reader's exchange, whichever thread asked for them.
+
+        Each device has its own queue and the worker serves them round robin, one job per
+        device with work waiting, so a reader with a lot to do can't starve the others.
+
+        device(name) returns an Executor for one device, to pass wherever one is expected:
+        AsyncRC522(executor=...), ReaderPool, loop.run_in_executor.
+
+        Per device it records the queue wait (submit to start) and how long each job held
+        the bus, and for the bus the total busy time. utilization() is the busy share of
+        the time since the previous call.
+    '''
+    def __init__(self, name='spi'):
+        self.name = name
+        self.lock = threading.Condition()
+        self.ready = deque()  # devices with jobs waiting, in the order they get their turn
+        self.thread = None
+        self.stopping = False
+        self.busy = 0
+        self.jobs = 0
+        self.checked = (time.monotonic(), 0)  # (time, busy) of the last utilization()
+        metrics.expose('rfid_gate_spi_busy_seconds_total', 'counter', 'Time the SPI bus was held by a job', lambda: self.busy, bus=name)
+        metrics.expose('rfid_gate_spi_jobs_total', 'counter', 'Jobs run on the SPI bus', lambda: self.jobs, bus=name)
+        metrics.expose('rfid_gate_spi_queued', 'gauge', 'Jobs waiting for the SPI bus', self.queued, bus=name)
+
+    def device(self, name):
+        return SpiDevice(self, name)
+
+    def submit(self, device, fn, *args, **kwargs):
+        future = Future()
+        with self.lock:
+            if self.stopping:
+                raise RuntimeError('SPI bus ' + self.name + ' is shut down')
+            if not device.queue:
+                self.ready.append(device)
+            device.queue.append((future, fn, args, kwargs, time.monotonic()))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.work, name=self.name, daemon=True)
+                self.thread.start()
+            self.lock.notify()
+        return future
+
+    def work(self):
+        while True:
+            with self.lock:
+                while not self.ready and not self.stopping:
+                    self.lock.wait()
+                if not self.ready:
+                    return
+                device = self.ready.popleft()
+                (future, fn, args, kwargs, submitted) = device.queue.popleft()
+                if device.queue:
+                    # Back of the line, every other waiting device goes first
+                    self.ready.append(device)
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = time.monotonic()
+            device.wait.observe(start - submitted)
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            held = time.monotonic() - start
+            device.hold.observe(held)
+            self.busy += held
+            self.jobs += 1
+
+    def queued(self):
+        return sum(len(device.queue) for device in list(self.ready))
+
+    def utilization(self):
+        '''Share of the time since the last call the bus was held, 0 to 1'''
+        now = time.monotonic()
+        (then, busy) = self.checked
+        self.checked = (now, self.busy)
+        return (self.busy - busy) / (now - then) if now > then else 0
+
+    def shutdown(self, wait=True):
+        '''Runs what is already queued, then stops the worker'''
+        with self.lock:
+            self.stopping = True
+            self.lock.notify()
+        if wait and self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+
+class SpiDevice(Executor):
+    '''One device's queue on a SpiBus'''
+    def __init__(self, bus, name):
+        self.bus = bus
+        self.name = name
+        self.queue = deque()
+        self.wait = metrics.histogram('rfid_gate_spi_queue_wait_seconds', 'Time a job waited for the SPI bus', bus=bus.name, device=name)
+        self.hold = metrics.histogram('rfid_gate_spi_hold_seconds', 'Time a job held the SPI bus', bus=bus.name, device=name)
+
+    def __repr__(self):
+        return 'SpiDevice(' + self.bus.name + ', ' + self.name + ')'
+
+    def submit(self, fn, *args, **kwargs):
+        return self.bus.submit(self, fn, *args, **kwargs)
+
+    def shutdown(self, wait=True, **kwargs):
+        # The bus outlives its devices, see SpiBus.shutdown
+        pass
+
+
+# The Pi's SPI0, shared by every reader
+spi_bus = SpiBus()
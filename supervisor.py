@@ -0,0 +1,64 @@
+import asyncio
+
+from metrics import metrics
+
+
+class Supervisor():
+    '''
+        Keeps a reader pipeline running in one flat loop, so memory and await depth stay
+        constant however long the gate runs (no task spawning itself per tap).
+
+        step -- coroutine function doing one pass, e.g. Lane.step
+        restart -- optional coroutine function called after a failed pass, e.g. Lane.restart
+
+        A failed pass is counted and followed by a back-off that doubles up to backoff_max,
+        a clean pass resets it.
+    '''
+    backoff_min = 0.1
+    backoff_max = 30
+
+    def __init__(self, name, step, restart=None):
+        self.name = name
+        self.step = step
+        self.restart = restart
+        self.passes = 0
+        self.errors = 0
+        self.restarts = 0
+        self.consecutive_errors = 0
+        self.last_error = None
+        metrics.expose('rfid_gate_passes_total', 'counter', 'Pipeline passes run', lambda: self.passes, pipeline=name)
+        metrics.expose('rfid_gate_errors_total', 'counter', 'Pipeline passes that failed', lambda: self.errors, pipeline=name)
+        metrics.expose('rfid_gate_restarts_total', 'counter', 'Pipeline restarts after a failure', lambda: self.restarts, pipeline=name)
+
+    def backoff(self):
+        return min(self.backoff_max, self.backoff_min * 2 ** (self.consecutive_errors - 1))
+
+    async def run(self):
+        while True:
+            try:
+                await self.step()
+                self.consecutive_errors = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.consecutive_errors += 1
+                self.last_error = repr(e)
+                delay = self.backoff()
+                print(self.name + ' failed: ' + self.last_error + ', restarting in ' + str(delay) + 's')
+                await asyncio.sleep(delay)
+                await self.try_restart()
+            self.passes += 1
+
+    async def try_restart(self):
+        if self.restart is None:
+            return
+        try:
+            await self.restart()
+            self.restarts += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Counted as part of the failure, the next pass gets another go
+            self.last_error = repr(e)
+            print(self.name + ' restart failed: ' + self.last_error)
@@ -0,0 +1,43 @@
+import time
+from collections import OrderedDict
+
+
+class TapCache():
+    '''
+        The UIDs a reader decided on recently, with their decision. A UID read again within
+        ttl seconds is a repeat of the same tap (a card resting on the reader, a badge waved
+        twice) and needs no second decision. Holds at most size UIDs, the oldest go first.
+
+        A decision rests on the employee's clocking state and tag, discard() drops it as
+        soon as either changes (see TagIndex.subscribe).
+    '''
+    def __init__(self, ttl=3, size=32):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()  # uid -> (expires, decision)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, uid):
+        '''The decision for uid if it was made less than ttl ago, otherwise None'''
+        entry = self.entries.get(uid)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self.entries[uid]
+            return None
+        return entry[1]
+
+    def discard(self, uid):
+        '''Forgets uid, and every UID it is the legacy prefix of'''
+        if not self.entries:
+            return
+        for key in [key for key in self.entries if key == uid or key.prefix() == uid]:
+            del self.entries[key]
+
+    def put(self, uid, decision):
+        self.entries.pop(uid, None)
+        self.entries[uid] = (time.monotonic() + self.ttl, decision)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+# Set before database.py is imported, the tests never touch the device's rfid_gate.db
+os.environ.setdefault('RFID_GATE_DB', os.path.join(tempfile.mkdtemp(prefix='rfid_gate_test'), 'rfid_gate.db'))
@@ -0,0 +1,88 @@
+import datetime
+
+import pytest
+
+from access_rules import AccessRules, Rule, rules
+from db_utils import TagEntry
+from uid import UID
+
+uid = UID([4, 23, 91, 192])
+now = datetime.datetime(2026, 10, 18, 12, 0)
+date = int(now.timestamp() * 1000)
+
+
+def entry(log_type, age, supervisor=False):
+    return TagEntry('rules', uid, log_type, date - age, supervisor, True)
+
+
+def hardware_check_tag(entry, direction):
+    '''The if/elif chain of the original hardware checkTag, allowed or not'''
+    if direction == 1 and entry.LogType == 4:
+        return True
+    elif direction == 2 and entry.LogType == 3:
+        return True
+    elif direction == 1 and entry.LogType == 3:
+        return False
+    elif direction == 2 and entry.LogType == 4:
+        return False
+    elif entry.LogDateUTC + 30000 > date:
+        return False
+    else:
+        return True
+
+
+corpus = [(log_type, age, direction)
+          for log_type in (0, 3, 4, 7)
+          for age in (0, 1000, 29999, 30000, 30001, 10 ** 9)
+          for direction in (1, 2)]
+
+
+@pytest.mark.parametrize('log_type, age, direction', corpus)
+def test_default_rules_match_the_original_chain(log_type, age, direction):
+    (allowed, reason) = rules.decide(entry(log_type, age), direction, now)
+    assert allowed == hardware_check_tag(entry(log_type, age), direction), reason
+
+
+@pytest.mark.parametrize('log_type, age, direction', corpus)
+def test_supervisors_only_skip_the_passback_window(log_type, age, direction):
+    (allowed, reason) = rules.decide(entry(log_type, age, supervisor=True), direction, now)
+    if (direction, log_type) in ((1, 3), (2, 4)):
+        assert (allowed, reason) == (False, 'already in' if direction == 1 else 'already out')
+    else:
+        assert allowed, reason
+
+
+@pytest.mark.parametrize('hour, direction, allowed', [
+    (21, 1, False), (23, 1, True), (3, 1, True), (7, 1, False),
+    (21, 2, True), (23, 2, True), (3, 2, True), (7, 2, True),
+])
+def test_night_shift(hour, direction, allowed):
+    night = AccessRules(shift_windows=[('22:00', '06:00')])
+    at = now.replace(hour=hour)
+    tag = TagEntry('rules', uid, 0, 0, False, True)
+    assert night.decide(tag, direction, at)[0] == allowed
+    if not allowed:
+        assert night.decide(tag, direction, at)[1] == 'outside shift'
+    # A supervisor may enter outside the shift
+    assert night.decide(TagEntry('rules', uid, 0, 0, True, True), direction, at)[0]
+
+
+def test_current_shift_is_worked_out_once_a_minute():
+    day = AccessRules(shift_windows=[('09:00', '17:00')])
+    start = now.replace(hour=8, minute=59, second=30).timestamp()
+    outside = day.current_shift(start)
+    assert outside == day.shift_offsets[8 * 60 + 59]
+    day.shift_offsets = None  # answered from the cached minute from here on
+    assert day.current_shift(start + 29.9) == outside
+    day.compile()
+    assert day.current_shift(start + 30) == day.shift_offsets[9 * 60] != outside
+    # A clock stepped back is looked up again
+    assert day.current_shift(start - 60) == outside
+
+
+def test_unknown_direction_is_refused():
+    assert rules.decide(entry(4, 10 ** 9), 3, now) == (False, 'unknown direction 3')
+    with pytest.raises(ValueError):
+        rules.check_direction(3)
+    with pytest.raises(ValueError):
+        Rule('sideways', True, direction=3)
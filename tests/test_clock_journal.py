@@ -0,0 +1,156 @@
+import os
+import json
+import uuid
+import asyncio
+
+import db_utils
+from benchmarks.stub_api import StubAPI
+from clock_journal import ClockJournal
+from database import Session
+from models import Employee, Clock
+from db_utils import DB
+from config_store import settings
+from token_manager import tokens
+from uid import UID
+
+
+def record(employee_id, log_type, date):
+    return {
+        'TransactionID': str(uuid.uuid4()),
+        'LogType': log_type,
+        'EmployeeID': employee_id,
+        'EmployeeRFID': '[4, 23, 91, 192, 128]',
+        'SerialNumber': 'journal test',
+        'CreatedDateUTC': date,
+    }
+
+
+def test_crash_recovery(tmp_path):
+    path = str(tmp_path / 'clock_journal.log')
+    Session.add(Employee(EmployeeID='journal-1', RfidCode='[4, 23, 91, 192, 128]', LogType=0, LogDateUTC=0))
+    Session.commit()
+
+    # Taps journaled, then the process dies before any flush, halfway through a write
+    journal = ClockJournal(path, DB.commitClocks)
+    journal.open()
+    records = [record('journal-1', 3 if i % 2 == 0 else 4, 1000 + i) for i in range(25)]
+    for one in records:
+        journal.append(one)
+    os.write(journal.fd, b'{"TransactionID":"torn","LogTy')
+    journal.close()
+
+    commits = []
+
+    def commit(batch):
+        commits.append(len(batch))
+        DB.commitClocks(batch)
+
+    journal = ClockJournal(path, commit)
+    journal.open()
+    assert commits == [len(records)]
+    Session.expire_all()
+    clocks = Session.query(Clock).filter_by(SerialNumber='journal test').all()
+    assert sorted(clock.TransactionID for clock in clocks) == sorted(one['TransactionID'] for one in records)
+    employee = Session.query(Employee).filter_by(EmployeeID='journal-1').one()
+    assert (employee.LogType, employee.LogDateUTC) == (records[-1]['LogType'], records[-1]['CreatedDateUTC'])
+    assert os.path.getsize(path) == 0
+    journal.close()
+
+    # Nothing left to replay
+    journal = ClockJournal(path, commit)
+    journal.open()
+    journal.close()
+    assert commits == [len(records)]
+    assert Session.query(Clock).filter_by(SerialNumber='journal test').count() == len(records)
+
+
+def test_replay_is_idempotent(tmp_path):
+    '''A crash after the commit but before the truncate replays records SQLite already has'''
+    path = str(tmp_path / 'clock_journal.log')
+    Session.add(Employee(EmployeeID='journal-2', RfidCode='', LogType=0, LogDateUTC=0))
+    Session.commit()
+    records = [record('journal-2', 3, 2000), record('journal-2', 4, 3000)]
+    DB.commitClocks(records)
+    # An older clock replayed later must not move the employee back in time
+    stale = record('journal-2', 3, 2500)
+    with open(path, 'w') as f:
+        for one in records + [stale]:
+            f.write(json.dumps(one) + '\n')
+
+    journal = ClockJournal(path, DB.commitClocks)
+    journal.open()
+    journal.close()
+    Session.expire_all()
+    assert Session.query(Clock).filter_by(EmployeeID='journal-2').count() == 3
+    employee = Session.query(Employee).filter_by(EmployeeID='journal-2').one()
+    assert (employee.LogType, employee.LogDateUTC) == (4, 3000)
+
+
+def test_group_commits_during_a_sync_pull(monkeypatch, tmp_path):
+    '''
+        Taps keep reaching SQLite through the journal's worker thread, and a token refresh
+        still writes the config on the loop thread, while a sync-down upserts its pages
+    '''
+    uid = UID([4, 23, 91, 193])
+    Session.add(Employee(EmployeeID='journal-3', RfidCode=uid.rfid_code(), LogType=0, LogDateUTC=0))
+    Session.commit()
+    DB.loadIndex()
+    settings.update(EmployeeSyncUTC=0, LogSyncUTC=0)
+    DB.validators.clear()
+    tokens.store('stub', 10 ** 9)
+    api = StubAPI(employees=1000, logs=1000).start()
+    monkeypatch.setattr(DB, 'api', api.url)
+    # Pages upserted a row at a time with a yield after each, the taps land in the middle
+    monkeypatch.setattr(DB, 'page_size', 400)
+    monkeypatch.setattr(DB, 'sync_chunk', 1)
+    monkeypatch.setattr(DB, 'sync_slice', 0)
+
+    failures = []
+    commits = []
+
+    def commit(batch):
+        try:
+            DB.commitClocks(batch)
+            commits.append(len(batch))
+        except Exception as e:
+            failures.append(repr(e))
+            raise
+
+    journal = ClockJournal(str(tmp_path / 'clock_journal.log'), commit)
+    monkeypatch.setattr(journal, 'flush_interval', 0.005)
+    monkeypatch.setattr(db_utils, 'clock_journal', journal)
+    monkeypatch.setattr(DB, 'journal', journal)
+    journal.open()
+
+    async def sync():
+        await DB.pull('employees', 'Employees', 'EmployeeID', 'EmployeeSyncUTC', DB.storeEmployees)
+        await DB.pull('logs', 'Logs', 'TransactionID', 'LogSyncUTC', DB.storeClocks)
+
+    async def run():
+        flusher = asyncio.ensure_future(journal.run())
+        syncing = asyncio.ensure_future(sync())
+        taps = 0
+        while not syncing.done():
+            DB.addClock(uid, taps % 2 + 1)
+            taps += 1
+            if taps % 50 == 0:
+                tokens.store('stub ' + str(taps), 10 ** 9)
+            await asyncio.sleep(0.001)
+        await syncing
+        while journal.pending:
+            await asyncio.sleep(0.01)
+        flusher.cancel()
+        return taps
+
+    try:
+        taps = asyncio.run(run())
+    finally:
+        api.stop()
+        journal.close()
+    assert failures == []
+    # The journal committed while the sync was running, not once at the end
+    assert len(commits) > 1
+    Session.expire_all()
+    assert Session.query(Clock).filter_by(EmployeeID='journal-3').count() == taps
+    assert Session.query(Employee).filter(Employee.EmployeeID.like('E%')).count() == 1000
+    assert Session.query(Clock).filter(Clock.TransactionID.like('T%')).count() == 1000
@@ -0,0 +1,77 @@
+import asyncio
+
+from benchmarks.stub_api import StubAPI
+from main import mainLoop
+from app_auth import Issuer
+from supervisor import Supervisor
+from db_utils import DB
+from token_manager import tokens
+from config_store import settings
+
+
+async def wait_for(condition, timeout=10):
+    for i in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+def test_sync_starts_once_the_api_is_reachable(monkeypatch):
+    '''Booted offline: authorization is retried, then the pulls run as usual'''
+    api = StubAPI(employees=5).start()
+    api.offline = True
+    monkeypatch.setattr(DB, 'api', api.url)
+    monkeypatch.setattr(Issuer, 'organisations_url', api.url.replace('/api/v1/', '/organisations'))
+    monkeypatch.setattr(mainLoop, 'auth_backoff_min', 0.01)
+    tokens.store('stub', 10 ** 9)
+    settings.update(OrganisationID='', EmployeeSyncUTC=0)
+    DB.validators.clear()
+
+    main_loop = mainLoop()
+    attempts = []
+    run = main_loop.issuer.run
+
+    async def attempt():
+        attempts.append(1)
+        if len(attempts) == 3:
+            # Back online for the third try
+            api.offline = False
+        return await run()
+    main_loop.issuer.run = attempt
+
+    async def boot():
+        task = asyncio.create_task(main_loop.sync())
+        try:
+            return await wait_for(lambda: settings.get().EmployeeSyncUTC == 5)
+        finally:
+            task.cancel()
+    try:
+        assert asyncio.run(boot())
+    finally:
+        api.stop()
+    assert len(attempts) == 3
+    assert settings.get().OrganisationID == 'stub-tenant'
+
+
+def test_dead_sync_is_restarted(monkeypatch):
+    monkeypatch.setattr(Supervisor, 'backoff_min', 0.01)
+    main_loop = mainLoop()
+    main_loop.issuer.run = lambda: asyncio.sleep(0)
+    runs = []
+
+    async def sync():
+        runs.append(1)
+        if len(runs) < 3:
+            raise RuntimeError('sync died')
+        await asyncio.sleep(10)
+    main_loop.supervisors[1].step = sync
+
+    async def boot():
+        task = asyncio.create_task(main_loop.sync())
+        try:
+            return await wait_for(lambda: len(runs) == 3)
+        finally:
+            task.cancel()
+    assert asyncio.run(boot())
+    assert main_loop.supervisors[1].errors == 2
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from metrics import Metrics
+
+
+def test_counter_and_exposed_values():
+    registry = Metrics()
+    taps = registry.counter('rfid_gate_test_taps_total', 'Taps', lane='0')
+    taps.inc()
+    taps.inc(2)
+    state = {'queued': 1.5}
+    registry.expose('rfid_gate_test_queued', 'gauge', 'Queued', lambda: state['queued'], bus='spi')
+    assert registry.counter('rfid_gate_test_taps_total', 'Taps', lane='0') is taps
+    assert registry.render() == (
+        '# HELP rfid_gate_test_taps_total Taps\n'
+        '# TYPE rfid_gate_test_taps_total counter\n'
+        'rfid_gate_test_taps_total{lane="0"} 3\n'
+        '# HELP rfid_gate_test_queued Queued\n'
+        '# TYPE rfid_gate_test_queued gauge\n'
+        'rfid_gate_test_queued{bus="spi"} 1.5\n'
+    )
+    # Read when scraped, not when exposed
+    state['queued'] = 4
+    assert 'rfid_gate_test_queued{bus="spi"} 4\n' in registry.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Metrics()
+    seconds = registry.histogram('rfid_gate_test_seconds', 'Stage time', buckets=(0.1, 1), stage='check')
+    for value in (0.05, 0.1, 0.5, 3):
+        seconds.observe(value)
+    assert registry.render().splitlines()[2:] == [
+        # A value on a bound counts in that bound's bucket, le is less than or equal
+        'rfid_gate_test_seconds_bucket{stage="check",le="0.1"} 2',
+        'rfid_gate_test_seconds_bucket{stage="check",le="1"} 3',
+        'rfid_gate_test_seconds_bucket{stage="check",le="+Inf"} 4',
+        'rfid_gate_test_seconds_sum{stage="check"} 3.65',
+        'rfid_gate_test_seconds_count{stage="check"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    registry = Metrics()
+    registry.counter('rfid_gate_test_total', 'Escaped', pipeline='lane "0"\\\n').inc()
+    assert registry.render().splitlines()[2] == 'rfid_gate_test_total{pipeline="lane \\"0\\"\\\\\\n"} 1'
+
+
+def test_a_failing_reader_leaves_the_rest():
+    registry = Metrics()
+    registry.expose('rfid_gate_test_broken', 'gauge', 'Broken', lambda: 1 / 0)
+    registry.counter('rfid_gate_test_total', 'Fine').inc()
+    assert registry.render().splitlines()[-1] == 'rfid_gate_test_total 1'
+
+
+def test_kind_is_fixed_per_family():
+    registry = Metrics()
+    registry.counter('rfid_gate_test_total', 'Taps')
+    with pytest.raises(ValueError):
+        registry.histogram('rfid_gate_test_total', 'Taps')
+
+
+def test_endpoint_serves_the_text_format():
+    registry = Metrics()
+    registry.counter('rfid_gate_test_total', 'Taps').inc()
+
+    async def get(path):
+        server = await asyncio.start_server(registry.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            (reader, writer) = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(('GET ' + path + ' HTTP/1.1\r\nHost: localhost\r\n\r\n').encode())
+            response = await reader.read()
+            writer.close()
+        return response.decode()
+
+    response = asyncio.run(get('/metrics'))
+    assert response.startswith('HTTP/1.0 200 OK\r\n')
+    assert 'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n' in response
+    assert response.endswith('\r\n\r\n' + registry.render())
+    assert asyncio.run(get('/other')).startswith('HTTP/1.0 404 Not Found\r\n')
@@ -0,0 +1,33 @@
+from sqlalchemy import create_engine
+
+from models import Base
+from migrations import MIGRATIONS, migrate, check_query_plans, schema_version
+
+
+def test_migrate_fresh_database(tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'fresh.db'))
+    assert migrate(engine, Base.metadata) == MIGRATIONS[-1][0]
+    # Already current, nothing to do the second time
+    assert migrate(engine, Base.metadata) == MIGRATIONS[-1][0]
+    with engine.connect() as conn:
+        assert schema_version(conn) == MIGRATIONS[-1][0]
+
+
+def test_no_full_table_scans(tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'plans.db'))
+    migrate(engine, Base.metadata)
+    assert check_query_plans(engine) == {}
+
+
+def test_unsynced_clocks_use_partial_index(tmp_path):
+    from db_utils import DB
+
+    engine = create_engine('sqlite:///' + str(tmp_path / 'unsynced.db'))
+    migrate(engine, Base.metadata)
+    # The query uploadClocks runs, with ServerDateUTC == 0 as a bound parameter
+    statement = DB.unsyncedClocks().statement.compile(engine)
+    assert list(statement.params.values()) == [0]
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(statement), tuple(statement.params.values()))
+        plan = [row[-1] for row in rows]
+    assert any('ix_clock_unsynced' in step for step in plan), plan
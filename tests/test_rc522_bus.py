@@ -0,0 +1,72 @@
+'''
+    SPI bus cost per reader operation, run on the simulator. The budgets are the transactions
+    each operation takes today with burst FIFO access, per shadow cache and IRQ setting. An
+    operation that gets more expensive fails here.
+'''
+import pytest
+
+from rc522 import RC522
+from rc522_sim import MFRC522Sim, VirtualCard
+
+OPERATIONS = ('request', 'anticoll', 'select_tag', 'card_auth', 'read', 'inventory')
+
+# (shadow, use_irq) -> {operation: SPI transactions}
+BUDGETS = {
+    (False, False): {'request': 15, 'anticoll': 15, 'select_tag': 20, 'card_auth': 11, 'read': 20, 'inventory': 96},
+    (False, True): {'request': 15, 'anticoll': 15, 'select_tag': 23, 'card_auth': 11, 'read': 23, 'inventory': 102},
+    (True, False): {'request': 13, 'anticoll': 13, 'select_tag': 18, 'card_auth': 10, 'read': 18, 'inventory': 86},
+    (True, True): {'request': 13, 'anticoll': 13, 'select_tag': 21, 'card_auth': 10, 'read': 21, 'inventory': 92},
+}
+
+
+def tap(shadow, use_irq, burst=True, latency=0):
+    '''One tap the long way round, then an inventory. Returns {operation: (transactions, bytes)}'''
+    sim = MFRC522Sim(latency=latency)
+    card = sim.place(VirtualCard([4, 23, 91, 192]))
+    reader = RC522(lambda pin: None, transport=sim, shadow=shadow, use_irq=use_irq)
+    reader.burst = burst
+    sim.track(reader, OPERATIONS)
+    sim.reset_stats()
+    (error, tag_type) = reader.request()
+    assert not error
+    (error, uid) = reader.anticoll()
+    assert not error
+    assert not reader.select_tag(uid)
+    assert not reader.card_auth(reader.auth_a, 4, [0xFF] * 6, uid)
+    (error, data) = reader.read(4)
+    assert not error
+    # Out of the field and back
+    card.power_off()
+    assert reader.inventory() == [([4, 23, 91, 192], 8)]
+    return {name: (op['transactions'], op['bytes']) for name, op in sim.stats.items()}
+
+
+@pytest.mark.parametrize('shadow, use_irq', sorted(BUDGETS))
+def test_transaction_budget(shadow, use_irq):
+    cost = tap(shadow, use_irq)
+    assert set(cost) == set(OPERATIONS)
+    for name, budget in BUDGETS[(shadow, use_irq)].items():
+        assert cost[name][0] <= budget, name
+
+
+@pytest.mark.parametrize('use_irq', [False, True])
+def test_shadow_cache_saves_reads(use_irq):
+    without = tap(False, use_irq)
+    cached = tap(True, use_irq)
+    for name in OPERATIONS:
+        assert cached[name][0] <= without[name][0], name
+    assert sum(cost[0] for cost in cached.values()) < sum(cost[0] for cost in without.values())
+
+
+def test_burst_fifo_saves_transactions():
+    burst = tap(True, True)
+    single = tap(True, True, burst=False)
+    for name in ('select_tag', 'card_auth', 'read', 'inventory'):
+        assert burst[name][0] < single[name][0], name
+    # A 16 byte block comes back in one frame instead of 16
+    assert single['read'][0] - burst['read'][0] >= 16
+
+
+def test_irq_wait_costs_no_bus_traffic():
+    '''With the card taking its time to answer, waiting on the IRQ line adds no polling reads'''
+    assert tap(True, True, latency=0.001) == tap(True, True)
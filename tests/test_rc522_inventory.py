@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from rc522 import RC522, cascade_frames
+from rc522_sim import MFRC522Sim, VirtualCard
+
+
+def reader_with(*uids):
+    sim = MFRC522Sim()
+    cards = [sim.place(VirtualCard(uid)) for uid in uids]
+    return (RC522(lambda pin: None, transport=sim, shadow=True), cards)
+
+
+@pytest.mark.parametrize('uid', [
+    [0x12, 0x34, 0x56, 0x78],
+    [0x04, 0x23, 0x91, 0xC0, 0x5A, 0x61, 0x80],
+    [0x04, 0x23, 0x91, 0xC0, 0x5A, 0x61, 0x80, 0x11, 0x22, 0x33],
+])
+def test_cascade_levels(uid):
+    (reader, cards) = reader_with(uid)
+    assert reader.inventory() == [(uid, 0x08)]
+    assert cards[0].state == cards[0].state_halt
+
+
+def test_cascade_frames():
+    assert cascade_frames([0x12, 0x34, 0x56, 0x78]) == [[0x12, 0x34, 0x56, 0x78, 0x08]]
+    frames = cascade_frames([0x04, 0x23, 0x91, 0xC0, 0x5A, 0x61, 0x80])
+    assert [frame[0] for frame in frames] == [0x88, 0xC0]
+    assert all(frame[0] ^ frame[1] ^ frame[2] ^ frame[3] == frame[4] for frame in frames)
+
+
+def test_collision_bit_is_resolved_to_one():
+    # The UIDs differ in bit 0 of their third byte, the 17th bit of the level 1 frame
+    (reader, cards) = reader_with([0x12, 0x34, 0x56, 0x78], [0x12, 0x34, 0x57, 0x78])
+    (error, tag_type) = reader.request()
+    assert not error
+    (error, frame, known_bits) = reader.anticoll_level(0x93, [0, 0, 0, 0, 0], 0)
+    assert (error, known_bits) == (False, 17)
+    assert frame[:2] == [0x12, 0x34] and frame[2] & 0x01
+    (error, frame, known_bits) = reader.anticoll_level(0x93, frame, known_bits)
+    assert (error, frame, known_bits) == (False, cascade_frames([0x12, 0x34, 0x57, 0x78])[0], 40)
+
+
+@pytest.mark.parametrize('uids', [
+    # Same size, colliding in the first byte
+    [[0x12, 0x34, 0x56, 0x78], [0x92, 0x34, 0x56, 0x78]],
+    # 7 byte UIDs with the same level 1 frame, they only collide at level 2
+    [[0x04, 0x23, 0x91, 0xC0, 0x5A, 0x61, 0x80], [0x04, 0x23, 0x91, 0xC1, 0x5A, 0x61, 0x80]],
+    # Different UID sizes, the ATQAs collide too
+    [[0x12, 0x34, 0x56, 0x78], [0x04, 0x23, 0x91, 0xC0, 0x5A, 0x61, 0x80],
+     [0x04, 0x23, 0x91, 0xC0, 0x5A, 0x61, 0x80, 0x11, 0x22, 0x33]],
+])
+def test_inventory_finds_colliding_cards(uids):
+    (reader, cards) = reader_with(*uids)
+    found = reader.inventory()
+    assert sorted(uid for uid, sak in found) == sorted(uids)
+    assert all(card.state == card.state_halt for card in cards)
+
+
+def test_inventory_of_a_full_field():
+    generator = random.Random(7)
+    uids = []
+    for size in (4, 7, 10, 4, 7, 10, 4, 7):
+        uid = [generator.randrange(256) for i in range(size)]
+        uid[0] = 0x04 if size > 4 else 0x10 + len(uids)
+        uids.append(uid)
+    (reader, cards) = reader_with(*uids)
+    assert sorted(uid for uid, sak in reader.inventory()) == sorted(uids)
+
+
+def test_halted_cards_stay_quiet_until_they_leave():
+    (reader, cards) = reader_with([0x12, 0x34, 0x56, 0x78], [0x92, 0x34, 0x56, 0x78])
+    assert len(reader.inventory()) == 2
+    # HALTed cards don't answer a REQA, only a card new to the field does
+    assert reader.inventory() == []
+    reader.transport.place(VirtualCard([0x21, 0x43, 0x65, 0x87]))
+    assert reader.inventory() == [([0x21, 0x43, 0x65, 0x87], 0x08)]
+    # Taken out of the field and back, they are found again
+    for card in cards:
+        card.power_off()
+    assert sorted(uid for uid, sak in reader.inventory()) == [[0x12, 0x34, 0x56, 0x78], [0x92, 0x34, 0x56, 0x78]]
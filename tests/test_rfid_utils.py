@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('RPi.GPIO')
+
+import rfid_utils
+from rfid_utils import RFID_UTIL
+
+
+class Lane():
+    def __init__(self, index, direction):
+        self.index = index
+        self.direction = direction
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    '''An RFID_UTIL with its GPIO writes recorded, the readers left alone'''
+    gate = RFID_UTIL.__new__(RFID_UTIL)
+    gate.pin_buzzer = 21
+    gate.buzzer = asyncio.Lock()
+    gate.writes = []
+    monkeypatch.setattr(rfid_utils.GPIO, 'output', lambda pin, value: gate.writes.append((pin, value)))
+    return gate
+
+
+def buzzer(gate):
+    return [value for (pin, value) in gate.writes if pin == gate.pin_buzzer]
+
+
+def test_lanes_take_turns_on_the_buzzer(gate):
+    async def run():
+        await asyncio.gather(gate.openRelay(Lane(0, 1)), gate.failBeep(), gate.openRelay(Lane(1, 2)))
+
+    asyncio.run(run())
+    # Each pattern whole and ending silent before the next: relay beep, fail beep, relay beep
+    assert buzzer(gate) == [1, 0] + [1, 0, 1, 0] + [1, 0]
+
+
+def test_relay_does_not_wait_for_the_buzzer(gate):
+    async def run():
+        refused = asyncio.ensure_future(gate.failBeep())
+        await asyncio.sleep(0)
+        await gate.openRelay(Lane(0, 1))
+        await refused
+
+    asyncio.run(run())
+    relay = RFID_UTIL.lanes[0]['pin_relay']
+    # Opened and closed again (at 0.5s) while the fail beep still had the buzzer (until 0.6s)
+    assert gate.writes == [(21, 1), (relay, 0), (21, 0), (21, 1), (relay, 1), (21, 0), (21, 1), (21, 0)]
+
+
+def test_cancelled_open_closes_relay_and_silences_buzzer(gate):
+    async def run():
+        task = asyncio.ensure_future(gate.openRelay(Lane(0, 1)))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.5)
+
+    asyncio.run(run())
+    relay = RFID_UTIL.lanes[0]['pin_relay']
+    assert [value for (pin, value) in gate.writes if pin == relay] == [0, 1]
+    assert buzzer(gate)[-1] == 0
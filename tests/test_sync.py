@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from benchmarks.stub_api import StubAPI
+from sqlalchemy.dialects.sqlite import insert
+
+from database import Session
+from models import Employee, Clock
+from db_utils import DB
+from token_manager import tokens
+from config_store import settings
+
+
+@pytest.fixture
+def stored_employees(monkeypatch):
+    Session.query(Employee).delete()
+    Session.commit()
+    settings.update(EmployeeSyncUTC=0)
+    DB.validators.clear()
+    tokens.store('stub', 10 ** 9)
+
+    def count():
+        Session.expire_all()
+        return Session.query(Employee).count()
+    return count
+
+
+@pytest.mark.parametrize('rows, ties, page_size', [
+    (50, 1, 10),  # one row per ServerDateUTC, pages end on a whole group
+    (50, 3, 10),  # every page boundary falls inside a group of equal ServerDateUTCs
+    (50, 25, 10),  # a group bigger than a page
+    (47, 4, 8),  # the last page is short and ends inside a group
+])
+def test_pull_keeps_rows_sharing_a_timestamp(monkeypatch, stored_employees, rows, ties, page_size):
+    api = StubAPI(employees=rows, ties=ties).start()
+    monkeypatch.setattr(DB, 'api', api.url)
+    monkeypatch.setattr(DB, 'page_size', page_size)
+    try:
+        asyncio.run(DB.pull('employees', 'Employees', 'EmployeeID', 'EmployeeSyncUTC', DB.storeEmployees))
+        assert stored_employees() == rows
+        assert settings.get().EmployeeSyncUTC == (rows - 1) // ties + 1
+        # Nothing new, a single short page
+        requests = api.requests
+        asyncio.run(DB.pull('employees', 'Employees', 'EmployeeID', 'EmployeeSyncUTC', DB.storeEmployees))
+        assert api.requests == requests + 1
+        assert stored_employees() == rows
+    finally:
+        api.stop()
+
+
+def test_pull_checkpoint_stops_before_an_unfinished_group(monkeypatch, stored_employees):
+    '''A pull cut off after the first page resumes from the last whole group, not the page's last row'''
+    api = StubAPI(employees=50, ties=3).start()
+    monkeypatch.setattr(DB, 'api', api.url)
+    monkeypatch.setattr(DB, 'page_size', 10)
+
+    async def store_one_page(items):
+        if api.requests == 2:
+            raise ConnectionError('offline')
+        await DB.storeEmployees(items)
+    try:
+        with pytest.raises(ConnectionError):
+            asyncio.run(DB.pull('employees', 'Employees', 'EmployeeID', 'EmployeeSyncUTC', store_one_page))
+        # Rows 0-9 are stored, row 9 is the first of ServerDateUTC 4
+        assert stored_employees() == 10
+        assert settings.get().EmployeeSyncUTC == 3
+        asyncio.run(DB.pull('employees', 'Employees', 'EmployeeID', 'EmployeeSyncUTC', DB.storeEmployees))
+        assert stored_employees() == 50
+    finally:
+        api.stop()
+
+
+def pending_clock(i, employee_id):
+    return {'TransactionID': 'U%08d' % i, 'LogType': 3, 'EmployeeID': employee_id, 'EmployeeRFID': '', 'SerialNumber': 'upload test',
+            'CreatedDateUTC': i, 'UpdatedDateUTC': i, 'DeletedDateUTC': 0, 'ServerDateUTC': 0}
+
+
+def test_rejected_clock_is_backed_off_and_retried_alone(monkeypatch):
+    api = StubAPI().start()
+    monkeypatch.setattr(DB, 'api', api.url)
+    monkeypatch.setattr(DB, 'upload_batch', 8)
+    Session.query(Clock).delete()
+    Session.execute(insert(Clock.__table__), [pending_clock(i, 'BAD' if i == 5 else 'E%06d' % i) for i in range(20)])
+    Session.commit()
+
+    def bad():
+        Session.expire_all()
+        return Session.query(Clock).filter_by(TransactionID='U00000005').one()
+    try:
+        # Bisected out of its batch (0-7, 0-3, 4-7, 4-5, 4, 5, 6-7) and recorded, the
+        # other 19 go through with batches 8-15 and 16-19
+        asyncio.run(DB.uploadClocks({}))
+        assert len(api.clocks) == 19
+        assert api.requests == 7 + 2
+        assert (bad().Rejections, bad().ServerDateUTC) == (1, 0)
+        assert 'Rejections' not in DB.row2dict(bad())
+
+        # Backed off, the next sync doesn't post it at all
+        requests = api.requests
+        asyncio.run(DB.uploadClocks({}))
+        assert api.requests == requests
+
+        # Once due it is posted on its own, and backed off for longer
+        rejected = bad().RejectedUTC
+        monkeypatch.setattr(DB, 'reject_backoff_min', 0)
+        asyncio.run(DB.uploadClocks({}))
+        assert api.requests == requests + 1
+        assert bad().Rejections == 2 and bad().RejectedUTC >= rejected
+        monkeypatch.setattr(DB, 'reject_backoff_min', 60)
+        assert not DB.retryDue(bad(), bad().RejectedUTC + 119 * 1000)
+        assert DB.retryDue(bad(), bad().RejectedUTC + 120 * 1000)
+    finally:
+        api.stop()
@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+import tap_cache
+import db_utils
+from tap_cache import TapCache
+from clock_journal import ClockJournal
+from database import Session
+from models import Employee
+from db_utils import DB, TagIndex
+from uid import UID
+
+card = UID([0x12, 0x34, 0x56, 0x78])
+other = UID([0x21, 0x43, 0x65, 0x87])
+seven = UID([0x04, 0x23, 0x91, 0xC0, 0x5A, 0x61, 0x80])
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_repeat_window(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tap_cache.time, 'monotonic', clock)
+    cache = TapCache(ttl=3)
+    cache.put(card, True)
+    clock.now += 2.9
+    assert cache.get(card) is True
+    assert cache.get(other) is None
+    clock.now += 0.1
+    assert cache.get(card) is None
+    assert len(cache) == 0
+    # A new decision starts a new window
+    cache.put(card, False)
+    clock.now += 2
+    cache.put(card, True)
+    clock.now += 2
+    assert cache.get(card) is True
+
+
+def test_size_bound():
+    cache = TapCache(size=2)
+    cache.put(card, True)
+    cache.put(other, True)
+    cache.put(seven, False)
+    assert len(cache) == 2
+    assert cache.get(card) is None
+    assert (cache.get(other), cache.get(seven)) == (True, False)
+
+
+def test_discard():
+    cache = TapCache()
+    cache.put(card, True)
+    cache.put(seven, True)
+    cache.discard(other)
+    assert len(cache) == 2
+    cache.discard(card)
+    assert cache.get(card) is None
+    # A legacy index entry is keyed by the prefix of the card the lane read
+    cache.discard(seven.prefix())
+    assert cache.get(seven) is None
+
+
+def employee(EmployeeID, uid, Termdate=None):
+    return SimpleNamespace(EmployeeID=EmployeeID, RfidCode=uid.rfid_code(), Rfid='', LogType=0, LogDateUTC=0, Supervisor=False, Termdate=Termdate)
+
+
+def test_index_updates_invalidate():
+    index = TagIndex()
+    index.update_employee(employee('tap-1', card))
+    index.update_employee(employee('tap-2', seven.prefix()))
+    cache = TapCache()
+    index.subscribe(cache.discard)
+    cache.put(card, False)
+    cache.put(seven, False)
+    cache.put(other, False)
+
+    # Clocked in on another lane
+    index.update_clock('tap-1', 3, 5000)
+    assert cache.get(card) is None
+    # Terminated by a sync
+    index.sync_employee({'EmployeeID': 'tap-2', 'RfidCode': seven.rfid_code(), 'Rfid': '', 'Supervisor': False, 'Termdate': '2026-10-18'})
+    assert cache.get(seven) is None
+    assert cache.get(other) is False
+    # Given a new tag, both the old and the new one are decided again
+    cache.put(card, False)
+    cache.put(other, False)
+    index.sync_employee({'EmployeeID': 'tap-1', 'RfidCode': other.rfid_code(), 'Rfid': '', 'Supervisor': False, 'Termdate': None})
+    assert (cache.get(card), cache.get(other)) == (None, None)
+
+
+def test_written_clock_invalidates(tmp_path, monkeypatch):
+    journal = ClockJournal(str(tmp_path / 'clock_journal.log'), DB.commitClocks)
+    journal.open()
+    monkeypatch.setattr(db_utils, 'clock_journal', journal)
+    monkeypatch.setattr(db_utils, 'tag_index', TagIndex())
+    Session.add(Employee(EmployeeID='tap-3', RfidCode=card.rfid_code(), LogType=0, LogDateUTC=0))
+    Session.commit()
+    db_utils.tag_index.load(Session)
+    cache = TapCache()
+    db_utils.tag_index.subscribe(cache.discard)
+    cache.put(card, False)
+    try:
+        DB.addClock(card, 1)
+    finally:
+        journal.close()
+    assert cache.get(card) is None
+    assert [record['EmployeeID'] for record in journal.pending] == ['tap-3']
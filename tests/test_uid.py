@@ -0,0 +1,99 @@
+import pickle
+from types import SimpleNamespace
+
+import pytest
+
+from rc522 import cascade_frames
+from uid import UID
+from db_utils import TagIndex
+
+four = UID([0x12, 0x34, 0x56, 0x78])
+seven = UID([0x04, 0x23, 0x91, 0xC0, 0x5A, 0x61, 0x80])
+ten = UID([0x04, 0x23, 0x91, 0xC0, 0x5A, 0x61, 0x80, 0x11, 0x22, 0x33])
+
+
+def every_level(uid):
+    return ' '.join(str(frame) for frame in cascade_frames(bytes(uid)))
+
+
+def test_value_semantics():
+    assert UID(bytes([0x12, 0x34, 0x56, 0x78])) == four
+    assert hash(UID([0x12, 0x34, 0x56, 0x78])) == hash(four)
+    # The size is part of the value, leading zero bytes make a different UID
+    assert UID([0, 0, 0, 1]) != UID([0, 0, 0, 0, 0, 0, 1])
+    assert (four.size, seven.size, ten.size) == (4, 7, 10)
+    assert str(seven) == '04:23:91:C0:5A:61:80'
+    assert repr(four) == 'UID(12:34:56:78)'
+    for uid in (four, seven, ten):
+        assert UID(bytes(uid)) == uid
+        assert pickle.loads(pickle.dumps(uid)) == uid
+        assert type(pickle.loads(pickle.dumps(uid))) is UID
+
+
+@pytest.mark.parametrize('data', [[], [1, 2], [1, 2, 3, 4, 5], list(range(11))])
+def test_invalid_sizes(data):
+    with pytest.raises(ValueError):
+        UID(data)
+
+
+def test_rfid_code_round_trip():
+    assert four.rfid_code() == '[18, 52, 86, 120, 8]'
+    assert UID.from_rfid_code(four.rfid_code()) == four
+    # A longer UID's RfidCode is its level 1 frame, which only keeps the first three bytes
+    assert seven.rfid_code() == '[136, 4, 35, 145, 62]'
+    assert UID.from_rfid_code(seven.rfid_code()) == seven.prefix() == UID([0x04, 0x23, 0x91])
+    assert UID.from_rfid_code(ten.rfid_code()) == ten.prefix()
+    assert seven.prefix().rfid_code() == seven.rfid_code()
+    assert four.prefix() is four
+
+
+def test_rfid_code_of_every_level():
+    assert UID.from_rfid_code(every_level(seven)) == seven
+    assert UID.from_rfid_code(every_level(ten)) == ten
+
+
+@pytest.mark.parametrize('text', [
+    None, '', 'no tag', '[18, 52, 86, 120]',
+    '[18, 52, 86, 120, 9]',  # wrong BCC
+    '[18, 52, 86, 300, 8]',  # not a byte
+    '[18, 52, 86, 120, 8] [18, 52, 86, 120, 8]',  # a frame after the last level
+    '[136, 4, 35, 145, 62] [136, 4, 35, 145, 62]',  # ends on a cascade tag after level 1
+])
+def test_not_an_rfid_code(text):
+    assert UID.from_rfid_code(text) is None
+
+
+def test_rfid_round_trip():
+    # Least significant byte first, like a desktop reader types the card's number
+    assert four.rfid() == '%010d' % 0x78563412
+    assert UID.from_rfid(four.rfid()) == four
+    assert UID.from_rfid('0000000001') == UID([1, 0, 0, 0])
+    assert seven.rfid() is None
+    for text in (None, '', 'abc', '4294967296', '-1'):
+        assert UID.from_rfid(text) is None
+
+
+def test_from_server_prefers_rfid_code():
+    assert UID.from_server(four.rfid_code(), UID([1, 2, 3, 4]).rfid()) == four
+    assert UID.from_server('', four.rfid()) == four
+    assert UID.from_server('[1, 2]', four.rfid()) == four
+    assert UID.from_server(None, None) is None
+
+
+def employee(EmployeeID, RfidCode, Rfid=''):
+    return SimpleNamespace(EmployeeID=EmployeeID, RfidCode=RfidCode, Rfid=Rfid, LogType=0, LogDateUTC=0, Supervisor=False, Termdate=None)
+
+
+def test_legacy_rfid_code_matches_by_prefix():
+    index = TagIndex()
+    # Stored before full UIDs were: only the level 1 frame of the 7 byte card
+    index.update_employee(employee('legacy', seven.rfid_code()))
+    index.update_employee(employee('short', four.rfid_code()))
+    assert [entry.EmployeeID for entry in index.get(seven)] == ['legacy']
+    assert [entry.EmployeeID for entry in index.get(ten)] == ['legacy']
+    assert [entry.EmployeeID for entry in index.get(four)] == ['short']
+    assert index.get(UID([0x04, 0x23, 0x92, 0xC0, 0x5A, 0x61, 0x80])) == ()
+    # A full UID stored since wins over the legacy prefix
+    index.update_employee(employee('full', every_level(seven)))
+    assert [entry.EmployeeID for entry in index.get(seven)] == ['full']
+    assert [entry.EmployeeID for entry in index.get(ten)] == ['legacy']
@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+
+from http_client import http
+from config_store import settings
+
+token_url = 'https://planaheadgroup.com/connect/token'
+
+
+def now_ms():
+    return int(datetime.datetime.now().timestamp() * 1000)
+
+
+class TokenManager():
+    '''
+        Keeps the API access token in memory. get() hands out a valid token without touching
+        SQLite, run() refreshes it refresh_margin seconds before it expires.
+
+        Refreshes are single-flight: everyone asking while one is in progress awaits the same
+        request. New tokens are written through to Config so a restart picks them up.
+    '''
+    refresh_margin = 60
+    retry_interval = 10
+    grace = 10  # seconds, a token closer than this to expiring is treated as expired
+    timeout = 10
+
+    def __init__(self):
+        self.token = None
+        self.expires = 0  # ms UTC
+        self.loaded = False
+        self.refreshing = None
+        self.refreshes = 0
+
+    def load(self):
+        config = settings.get()
+        if config.LastAuthDateUTC:
+            self.token = config.AccessToken
+            self.expires = config.LastAuthDateUTC + config.ExpiredToken * 1000
+        self.loaded = True
+
+    def time_left(self):
+        return (self.expires - now_ms()) / 1000
+
+    def valid(self):
+        return self.token is not None and self.time_left() > self.grace
+
+    async def get(self):
+        if not self.loaded:
+            self.load()
+        if self.valid():
+            return self.token
+        return await self.refresh()
+
+    async def refresh(self, stale=None):
+        '''
+            Fetches a new token and returns it. stale is the token a caller just saw
+            rejected, if another refresh already replaced it that one is returned.
+        '''
+        if stale is not None and self.token != stale and self.valid():
+            return self.token
+        if self.refreshing is None:
+            self.refreshing = asyncio.ensure_future(self.fetch())
+            self.refreshing.add_done_callback(self.refreshed)
+        # Shielded, a cancelled caller must not cancel the request the others are waiting on
+        return await asyncio.shield(self.refreshing)
+
+    def refreshed(self, future):
+        self.refreshing = None
+
+    async def fetch(self):
+        files = {
+            'grant_type': (None, 'client_credentials'),
+            'client_id': (None, 'client_id'),
+            'client_secret': (None, 'A8E7EA2D-285A-4908-96D4-EB249F179DBD'),
+            'scope': (None, 'pahapi pahapi.read roles'),
+        }
+        req = await http.post(token_url, deadline=self.timeout, files=files)
+        if req.status_code != 200:
+            raise Exception('token refresh failed: ' + str(req.status_code) + ' ' + req.text)
+        tokenset = req.json()
+        print('Successful Refresh Token Response:')
+        self.store(tokenset['access_token'], tokenset['expires_in'])
+        return self.token
+
+    def store(self, AccessToken, ExpiredToken):
+        date = now_ms()
+        self.token = AccessToken
+        self.expires = date + ExpiredToken * 1000
+        self.loaded = True
+        self.refreshes += 1
+        settings.update(AccessToken=AccessToken, ExpiredToken=ExpiredToken, LastAuthDateUTC=date)
+
+    async def run(self):
+        while True:
+            if not self.loaded:
+                self.load()
+            wait = self.time_left() - self.refresh_margin
+            if wait > 0:
+                # Checked again after the sleep, get() may have refreshed in the meantime
+                await asyncio.sleep(wait)
+                continue
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(str(e))
+            await asyncio.sleep(self.retry_interval)
+
+
+tokens = TokenManager()
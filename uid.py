@@ -0,0 +1,115 @@
+'''
+    The one form a tag's UID takes between the reader, the tap cache, the tag index and the
+    clock journal. A UID is an immutable int of its 4, 7 or 10 bytes tagged with its size,
+    so hashing and comparing it is a single int operation.
+
+    The server knows a tag by two strings, both decoded and encoded here:
+
+        RfidCode -- str() of the cascade level 1 anticollision frame, e.g.
+                    "[136, 4, 23, 91, 192]". For a 7 or 10 byte UID that frame is the
+                    0x88 cascade tag and the first three bytes only, so such a code decodes
+                    to a 3 byte prefix UID that matches every UID starting with those bytes.
+        Rfid     -- the number printed on a 4 byte card: its UID as a zero padded 10 digit
+                    decimal, least significant byte first like desktop readers type it.
+'''
+import re
+
+from rc522 import cascade_frames
+
+sizes = (4, 7, 10)
+prefix_size = 3  # what a legacy RfidCode of a 7 or 10 byte UID still identifies
+numbers = re.compile(r'\d+')
+
+
+class UID(int):
+    '''
+        The UID's bytes as a big endian int with the size above bit 80. Being an int, hash
+        and == are the interpreter's own and a UID costs no more memory than the number.
+    '''
+    __slots__ = ()
+
+    def __new__(cls, data):
+        '''data -- the UID's bytes, as read by RC522.select_card'''
+        data = bytes(data)
+        if len(data) not in sizes and len(data) != prefix_size:
+            raise ValueError('UID of ' + str(len(data)) + ' bytes')
+        return int.__new__(cls, len(data) << 80 | int.from_bytes(data, 'big'))
+
+    def __reduce__(self):
+        return (UID, (bytes(self),))
+
+    @property
+    def size(self):
+        return int(self) >> 80
+
+    def __bytes__(self):
+        return (self & ((1 << 80) - 1)).to_bytes(self.size, 'big')
+
+    def __str__(self):
+        return bytes(self).hex(':').upper()
+
+    def __repr__(self):
+        return 'UID(' + str(self) + ')'
+
+    def prefix(self):
+        '''The UID a legacy RfidCode of this one decodes to, itself for a 4 byte UID'''
+        if self.size == 4:
+            return self
+        return UID(bytes(self)[:prefix_size])
+
+    def rfid_code(self):
+        '''Server RfidCode, the cascade level 1 frame'''
+        if self.size == prefix_size:
+            data = [0x88] + list(bytes(self))
+            return str(data + [data[0] ^ data[1] ^ data[2] ^ data[3]])
+        return str(cascade_frames(bytes(self))[0])
+
+    def rfid(self):
+        '''Server Rfid, None for a UID that isn't 4 bytes'''
+        if self.size != 4:
+            return None
+        return '%010d' % int.from_bytes(bytes(self), 'little')
+
+    @staticmethod
+    def from_rfid_code(text):
+        '''
+            UID of a server RfidCode, None when it isn't one. Besides the level 1 frame the
+            frames of all cascade levels one after another are accepted, giving the full UID.
+        '''
+        if not text:
+            return None
+        data = [int(number) for number in numbers.findall(text)]
+        if not data or len(data) % 5 or any(byte > 255 for byte in data):
+            return None
+        uid = []
+        for i in range(0, len(data), 5):
+            frame = data[i:i + 5]
+            if frame[0] ^ frame[1] ^ frame[2] ^ frame[3] != frame[4]:
+                return None
+            if frame[0] == 0x88:
+                uid += frame[1:4]
+            else:
+                uid += frame[0:4]
+                if i + 5 != len(data):
+                    return None
+                return UID(uid)
+        # Ended on a cascade tag, only the level 1 frame was stored
+        return UID(uid) if len(uid) == prefix_size else None
+
+    @staticmethod
+    def from_rfid(text):
+        '''4 byte UID of a server Rfid, None when it isn't one'''
+        if not text or not text.strip().isdigit():
+            return None
+        number = int(text)
+        if number >= 1 << 32:
+            return None
+        return UID(number.to_bytes(4, 'little'))
+
+    @staticmethod
+    def from_server(RfidCode, Rfid):
+        '''The UID an employee's tag fields describe, RfidCode first'''
+        uid = UID.from_rfid_code(RfidCode)
+        if uid is None:
+            uid = UID.from_rfid(Rfid)
+        return uid